@@ -0,0 +1,112 @@
+import argparse
+import random
+import time
+from array import array
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Tuple
+
+@dataclass
+class DataclassCity:
+    min : float
+    max : float
+    sum : float
+    count : int
+
+@dataclass
+class SlottedCity:
+    __slots__ = ("min", "max", "sum", "count")
+    min : float
+    max : float
+    sum : float
+    count : int
+
+def dataclass_layout(rows: List[Tuple[bytes, float]]) -> None:
+    """The original layout: a City dataclass per station, looked up with `in` and `[]`."""
+    result : Dict[bytes, DataclassCity] = dict()
+    for location, measurement in rows:
+        if location not in result:
+            result[location] = DataclassCity(measurement, measurement, measurement, 1)
+        else:
+            _result = result[location]
+            if measurement < _result.min:
+                _result.min = measurement
+            if measurement > _result.max:
+                _result.max = measurement
+            _result.sum += measurement
+            _result.count += 1
+
+def slotted_layout(rows: List[Tuple[bytes, float]]) -> None:
+    """The layout of process_chunk: a slotted City per station, looked up once with `get`."""
+    result : Dict[bytes, SlottedCity] = dict()
+    for location, measurement in rows:
+        _result = result.get(location)
+        if _result is None:
+            result[location] = SlottedCity(measurement, measurement, measurement, 1)
+        else:
+            if measurement < _result.min:
+                _result.min = measurement
+            if measurement > _result.max:
+                _result.max = measurement
+            _result.sum += measurement
+            _result.count += 1
+
+def list_layout(rows: List[Tuple[bytes, float]]) -> None:
+    """The layout of py_1brc_2.py: a [min, max, sum, count] list per station."""
+    result : Dict[bytes, List[float]] = dict()
+    for location, measurement in rows:
+        _result = result.get(location)
+        if _result is None:
+            result[location] = [measurement, measurement, measurement, 1]
+        else:
+            if measurement < _result[0]:
+                _result[0] = measurement
+            if measurement > _result[1]:
+                _result[1] = measurement
+            _result[2] += measurement
+            _result[3] += 1
+
+def array_layout(rows: List[Tuple[bytes, float]]) -> None:
+    """A station to offset index into one array('d') of consecutive (min, max, sum, count) records."""
+    offsets : Dict[bytes, int] = dict()
+    records = array("d")
+    for location, measurement in rows:
+        offset = offsets.get(location)
+        if offset is None:
+            offsets[location] = len(records)
+            records.extend((measurement, measurement, measurement, 1))
+        else:
+            if measurement < records[offset]:
+                records[offset] = measurement
+            if measurement > records[offset + 1]:
+                records[offset + 1] = measurement
+            records[offset + 2] += measurement
+            records[offset + 3] += 1
+
+LAYOUTS : Dict[str, Callable[[List[Tuple[bytes, float]]], None]] = {
+    "dataclass": dataclass_layout,
+    "slotted": slotted_layout,
+    "list": list_layout,
+    "array": array_layout,
+}
+
+def main() -> None:
+    """Time the per row update of each accumulator layout on pre-parsed rows."""
+    parser = argparse.ArgumentParser(description="Microbenchmark station accumulator layouts")
+    parser.add_argument("-n", "--rows", type=int, default=2_000_000)
+    parser.add_argument("-s", "--stations", type=int, default=413)
+    parser.add_argument("-r", "--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    names = [f"station-{i}".encode() for i in range(args.stations)]
+    rows = [(rng.choice(names), rng.randint(-999, 999) / 10) for _ in range(args.rows)]
+    for name, layout in LAYOUTS.items():
+        times = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            layout(rows)
+            times.append(time.perf_counter() - start)
+        print(f"{name:>10}: {min(times) / args.rows * 1e9:6.1f} ns/row")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import py_1brc_final
+
+def time_process_chunk(file_path: str, block_size: int) -> float:
+    """
+    Time a single process_chunk call over the whole file.
+    Args:
+        file_path (str): The measurements file.
+        block_size (int): The block size to parse with, 0 for the mm.readline loop.
+    Returns:
+        float: The elapsed time in seconds.
+    """
+    py_1brc_final.file_path = file_path
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        py_1brc_final.process_chunk(0, os.path.getsize(file_path), py_1brc_final.fixed_point, block_size)
+    return time.perf_counter() - start
+
+def main() -> None:
+    """Compare the mm.readline loop against block parsing with a few block sizes on one core."""
+    parser = argparse.ArgumentParser(description="Benchmark block parsing against the mm.readline loop")
+    parser.add_argument("file_path", nargs="?", default="measurements_100mil.txt")
+    parser.add_argument("-r", "--repeat", type=int, default=3)
+    parser.add_argument("-b", "--block-sizes", type=int, nargs="+", default=[0, 1 << 20, 4 << 20, 8 << 20, 32 << 20])
+    args = parser.parse_args()
+
+    with open(args.file_path, "rb") as file:
+        rows = sum(block.count(b"\n") for block in iter(lambda: file.read(1 << 24), b""))
+    for block_size in args.block_sizes:
+        best = min(time_process_chunk(args.file_path, block_size) for _ in range(args.repeat))
+        label = f"block {block_size >> 20} MB" if block_size else "mm.readline"
+        print(f"{label:>14}: {best:8.3f} s  {rows / best / 1e6:6.2f} M rows/s")
+
+if __name__ == "__main__":
+    main()
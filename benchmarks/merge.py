@@ -0,0 +1,86 @@
+import argparse
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import py_1brc_final
+from stations import City
+
+# Latest time.time() at which a worker finished a chunk, shared by the pool workers.
+last_chunk_done : Optional[Any] = None
+
+def init_worker(shared_value: Any) -> None:
+    """Store the shared completion time in each worker."""
+    global last_chunk_done
+    last_chunk_done = shared_value
+
+def synthetic_chunk(seed: int, stations: int, work: float) -> Dict[bytes, City]:
+    """
+    Stand in for process_chunk: burn `work` seconds, then return a result for every station.
+    Args:
+        seed (int): Seed for the aggregates.
+        stations (int): The number of distinct stations in the result.
+        work (float): The time to spend before returning, like parsing a segment.
+    Returns:
+        Dict[bytes, City]: A result shaped like the one of process_chunk in fixed point mode.
+    """
+    deadline = time.perf_counter() + work
+    while time.perf_counter() < deadline:
+        pass
+    rng = random.Random(seed)
+    result = {f"station-{i:05d}".encode(): City(rng.randint(-999, 0), rng.randint(0, 999), rng.randint(-10**6, 10**6), rng.randint(1, 1000)) for i in range(stations)}
+    assert last_chunk_done is not None
+    with last_chunk_done.get_lock():
+        last_chunk_done.value = max(last_chunk_done.value, time.time())
+    return result
+
+def run(mode: str, num_processes: int, chunks: int, stations: int, work: float) -> List[float]:
+    """
+    Merge synthetic chunk results with the given mode.
+    Args:
+        mode (str): "collect" waits for all results like the old starmap, "stream" and "tree" are the modes of py_1brc_final.main.
+        num_processes (int): The number of worker processes.
+        chunks (int): The number of chunk results.
+        stations (int): The number of stations per result.
+        work (float): The parse time simulated per chunk.
+    Returns:
+        List[float]: The total time, and the time from the last chunk finishing to the merged result.
+    """
+    shared_value = multiprocessing.Value("d", 0.0)
+    tasks = [(synthetic_chunk, (seed, stations, work)) for seed in range(chunks)]
+    with multiprocessing.Pool(num_processes, initializer=init_worker, initargs=(shared_value,)) as pool:
+        start = time.perf_counter()
+        if mode == "collect":
+            py_1brc_final.merge_results(pool.map(py_1brc_final.run_task, tasks))
+        elif mode == "stream":
+            py_1brc_final.merge_results(pool.imap_unordered(py_1brc_final.run_task, tasks))
+        else:
+            py_1brc_final.tree_merge(pool, tasks)
+        end = time.time()
+        total = time.perf_counter() - start
+    return [total, end - shared_value.value]
+
+def main() -> None:
+    """Compare how long the parent keeps merging after the last chunk finished."""
+    parser = argparse.ArgumentParser(description="Benchmark merging chunk results")
+    parser.add_argument("-p", "--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("-c", "--chunks", type=int, default=256)
+    parser.add_argument("-s", "--stations", type=int, default=10_000)
+    parser.add_argument("-w", "--work", type=float, default=0.05, help="Simulated parse time per chunk in seconds")
+    parser.add_argument("-r", "--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    for mode in ("collect", "stream", "tree"):
+        runs = [run(mode, args.processes, args.chunks, args.stations, args.work) for _ in range(args.repeat)]
+        print(
+            f"{mode:>8}: total {statistics.median(run[0] for run in runs):7.3f} s"
+            f"  final merge {statistics.median(run[1] for run in runs) * 1000:9.1f} ms"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import argparse
+import contextlib
+import io
+import multiprocessing
+import os
+import statistics
+import sys
+import time
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import py_1brc_final
+from stations import City
+
+def drop_page_cache(file_path: str) -> None:
+    """
+    Evict the file from the page cache so the next run reads it from disk (Linux only).
+    Args:
+        file_path (str): The file to evict.
+    """
+    fd = os.open(file_path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+
+def run(file_path: str, num_processes: int, segment_size: int, cold: bool) -> Tuple[float, float, int]:
+    """
+    Run the multiprocessing pipeline of py_1brc_final.main and time when each chunk result arrives.
+    The tail is the time from the first moment a worker had nothing left to pull (the arrival of the
+    result num_processes places from the end) until the last result arrived.
+    Args:
+        file_path (str): The measurements file.
+        num_processes (int): The number of worker processes.
+        segment_size (int): The segment size, 0 for one chunk per process.
+        cold (bool): Drop the file from the page cache before the run.
+    Returns:
+        Tuple[float, float, int]: The total time, the tail time and the number of chunks.
+    """
+    if cold:
+        drop_page_cache(file_path)
+    py_1brc_final.file_path = file_path
+    arrivals : List[float] = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        chunk_results = py_1brc_final.identify_chunks(num_processes, segment_size)
+        tasks = [(py_1brc_final.process_chunk, (chunk_start, chunk_end, py_1brc_final.fixed_point, py_1brc_final.block_size, False, file_path)) for chunk_start, chunk_end in chunk_results]
+        shared_results : Dict[bytes, City] = dict()
+        with multiprocessing.Pool(num_processes) as pool:
+            for return_dict in pool.imap_unordered(py_1brc_final.run_task, tasks):
+                py_1brc_final.merge_into(shared_results, return_dict)
+                arrivals.append(time.perf_counter() - start)
+        total = time.perf_counter() - start
+    return total, total - arrivals[max(0, len(arrivals) - num_processes)], len(chunk_results)
+
+def main() -> None:
+    """Compare the static one-chunk-per-core split against dynamically pulled segments."""
+    parser = argparse.ArgumentParser(description="Benchmark chunk scheduling")
+    parser.add_argument("file_path", nargs="?", default="measurements_100mil.txt")
+    parser.add_argument("-p", "--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("-r", "--repeat", type=int, default=3)
+    parser.add_argument("-s", "--segment-sizes", type=int, nargs="+", default=[0, 16 << 20, 32 << 20, 64 << 20])
+    parser.add_argument("--cold", action="store_true", help="Drop the file from the page cache before every run (Linux)")
+    args = parser.parse_args()
+
+    for segment_size in args.segment_sizes:
+        runs = [run(args.file_path, args.processes, segment_size, args.cold) for _ in range(args.repeat)]
+        label = f"segments {segment_size >> 20} MB" if segment_size else "static split"
+        print(
+            f"{label:>16} ({runs[0][2]:4d} chunks): total {statistics.median(run[0] for run in runs):7.3f} s"
+            f"  tail {statistics.median(run[1] for run in runs):7.3f} s  (median of {args.repeat}, {'cold' if args.cold else 'cached'})"
+        )
+
+if __name__ == "__main__":
+    main()
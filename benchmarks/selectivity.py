@@ -0,0 +1,64 @@
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import onebrc
+from onebrc import query
+from suite import dataset
+
+def time_query(file_path: str, stations: List[str], workers: int, repeat: int, find_limit: int) -> float:
+    """
+    Time `onebrc.summarize` on the text, without a sidecar.
+    Args:
+        file_path (str): The measurements file.
+        stations (List[str]): The stations to aggregate.
+        workers (int): The number of worker processes.
+        repeat (int): The number of runs.
+        find_limit (int): The limit of `query.query_range` to run with, 0 to split every line.
+    Returns:
+        float: The best time in seconds.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        onebrc.summarize(file_path, stations, workers=workers, chunk_size=0, use_index=False, limit=find_limit)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def main() -> None:
+    """Compare a station subset query against a full run as the number of requested stations grows."""
+    parser = argparse.ArgumentParser(description="Benchmark station subset queries at several selectivities")
+    parser.add_argument("-n", "--records", type=int, default=5_000_000)
+    parser.add_argument("-s", "--stations", type=int, default=10_000, help="Generate this many stations")
+    parser.add_argument("-k", "--counts", type=int, nargs="+", default=[1, 4, 16, 64, 256], help="Numbers of stations to query")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("-r", "--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+    args = parser.parse_args()
+
+    file_path = dataset(args.data_dir, args.records, args.seed, args.stations)
+    times = []
+    for _ in range(args.repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            results = onebrc.run(file_path, onebrc.BACKENDS["numpy"], args.workers)
+            times.append(time.perf_counter() - start)
+    rows = sum(city.count for city in results.values())
+    print(f"{'full run':>20}: {min(times):8.3f} s  {rows / min(times) / 1e6:7.2f} M rows/s")
+    names = sorted(results)
+    for count in args.counts:
+        # Spread the stations over the sorted names, so they are not all the most or least frequent.
+        stations = [name.decode() for name in names[::max(len(names) // count, 1)][:count]]
+        selected = sum(results[name.encode()].count for name in stations) / rows
+        for label, limit in (("find", max(count, query.find_limit)), ("split", 0)):
+            best = time_query(file_path, stations, args.workers, args.repeat, limit)
+            print(f"{f'{count} stations, {label}':>20}: {best:8.3f} s  {rows / best / 1e6:7.2f} M rows/s  ({selected:.2%} of rows)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import onebrc
+from onebrc.generate import generate, synthetic_stations
+from scheduler import drop_page_cache
+
+def dataset_label(stations: int, name_bytes: int, shared_prefix: int, zipf: float) -> str:
+    """
+    Returns:
+        str: A short description of the generator mode, "standard" for the stations of CreateMeasurement.
+    """
+    parts = []
+    if stations:
+        parts.append(f"{stations} stations")
+    if name_bytes:
+        parts.append(f"names to {name_bytes} B")
+    if shared_prefix:
+        parts.append(f"{shared_prefix} B prefix")
+    if zipf:
+        parts.append(f"zipf {zipf:g}")
+    return ", ".join(parts) or "standard"
+
+def dataset(data_dir: str, records: int, seed: int, stations: int = 0, name_bytes: int = 0, shared_prefix: int = 0, zipf: float = 0) -> str:
+    """
+    Generate a measurements file with `onebrc.generate`, or reuse it if it was generated before.
+    Args:
+        data_dir (str): The directory holding the generated files.
+        records (int): The number of rows.
+        seed (int): The seed of the generator, so every host benchmarks the same file.
+        stations (int): The number of stations, 0 for the stations of CreateMeasurement.
+        name_bytes (int): Pad names with multi-byte UTF-8 up to this many bytes, see `synthetic_stations`.
+        shared_prefix (int): Give all names a common prefix of this many bytes.
+        zipf (float): The Zipf exponent of the station frequencies, 0 for uniform.
+    Returns:
+        str: The path of the file.
+    """
+    file_path = os.path.join(data_dir, f"measurements_{records}_{seed}_{stations}_{name_bytes}_{shared_prefix}_{zipf:g}.txt")
+    if not os.path.exists(file_path):
+        os.makedirs(data_dir, exist_ok=True)
+        kwargs : Dict[str, Any] = {"zipf": zipf}
+        if stations or name_bytes or shared_prefix:
+            kwargs["stations"] = synthetic_stations(stations or 413, seed, name_bytes, shared_prefix)
+        generate(file_path + ".tmp", records, seed, os.cpu_count() or 1, **kwargs)
+        os.replace(file_path + ".tmp", file_path)
+    return file_path
+
+def time_runs(file_path: str, backend: onebrc.Backend, workers: int, repeat: int, cold: bool, executor: str = "auto") -> List[float]:
+    """
+    Time repeated runs of `onebrc.run`, including starting the worker pool.
+    Args:
+        file_path (str): The measurements file.
+        backend (onebrc.Backend): The backend.
+        workers (int): The number of workers.
+        repeat (int): The number of runs.
+        cold (bool): Drop the file from the page cache before every run (Linux).
+        executor (str): The executor of `onebrc.run`.
+    Returns:
+        List[float]: The time of each run in seconds.
+    """
+    times = []
+    for _ in range(repeat):
+        if cold:
+            drop_page_cache(file_path)
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            onebrc.run(file_path, backend, workers, executor=executor)
+            times.append(time.perf_counter() - start)
+    return times
+
+def summarize(times: List[float], records: int) -> Dict[str, float]:
+    """
+    Args:
+        times (List[float]): The time of each run in seconds.
+        records (int): The number of rows per run.
+    Returns:
+        Dict[str, float]: The median and 95th percentile time, and rows per second at the median.
+    """
+    median = statistics.median(times)
+    p95 = statistics.quantiles(times, n=20, method="inclusive")[18] if len(times) > 1 else times[0]
+    return {"median": median, "p95": p95, "rows_per_s": records / median}
+
+def worker_counts(cpu_count: int) -> List[int]:
+    """
+    Returns:
+        List[int]: The worker counts of the scaling sweep, powers of two from 1 up to and including cpu_count.
+    """
+    counts = [1]
+    while counts[-1] * 2 < cpu_count:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != cpu_count:
+        counts.append(cpu_count)
+    return counts
+
+def result_key(result: Dict[str, Any]) -> str:
+    """The identity of a measurement, used to match it against the baseline."""
+    return f"{result['records']} rows ({result['dataset']}), {result['backend']}, {result['workers']} {result['executor']}, {result['cache']}"
+
+def compare(results: List[Dict[str, Any]], baseline: List[Dict[str, Any]], threshold: float) -> List[str]:
+    """
+    Compare the median of every measurement against the same measurement in the baseline.
+    Args:
+        results (List[Dict]): The measurements of this run.
+        baseline (List[Dict]): The measurements of the baseline run.
+        threshold (float): The relative slowdown of the median that counts as a regression.
+    Returns:
+        List[str]: A description of each regression.
+    """
+    baseline_medians = {result_key(result): result["median"] for result in baseline}
+    regressions = []
+    for result in results:
+        key = result_key(result)
+        if key not in baseline_medians:
+            continue
+        ratio = result["median"] / baseline_medians[key]
+        print(f"{key:>64}: {ratio:6.2f}x baseline")
+        if ratio > 1 + threshold:
+            regressions.append(f"{key}: {result['median']:.3f} s vs {baseline_medians[key]:.3f} s")
+    return regressions
+
+def main() -> None:
+    """Benchmark the backends of `python -m onebrc` on generated datasets and compare against a baseline."""
+    parser = argparse.ArgumentParser(description="Benchmark the onebrc backends")
+    parser.add_argument("-n", "--records", type=int, nargs="+", default=[100_000, 1_000_000], help="Dataset sizes in rows")
+    parser.add_argument("-b", "--backends", nargs="+", default=list(onebrc.BACKENDS), choices=list(onebrc.BACKENDS))
+    parser.add_argument("-r", "--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+    parser.add_argument("--stations", type=int, default=0, help="Generate this many stations, e.g. 10000")
+    parser.add_argument("--name-bytes", type=int, default=0, help="Pad station names with multi-byte UTF-8 up to this many bytes")
+    parser.add_argument("--shared-prefix", type=int, default=0, help="Give all station names a common prefix of this many bytes")
+    parser.add_argument("--zipf", type=float, default=0, help="Zipf exponent of the station frequencies, 0 for uniform")
+    parser.add_argument("-e", "--executor", choices=["auto", "processes", "threads"], default="auto", help="The executor of onebrc.run")
+    parser.add_argument("--cold", action="store_true", help="Drop the file from the page cache before every run (Linux)")
+    parser.add_argument("--scaling", action="store_true", help="Sweep the worker count from 1 to the number of CPUs")
+    parser.add_argument("-o", "--output", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare against the results in this JSON file")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Relative slowdown reported as a regression")
+    args = parser.parse_args()
+
+    cpu_count = os.cpu_count() or 1
+    results : List[Dict[str, Any]] = []
+    for records in args.records:
+        file_path = dataset(args.data_dir, records, args.seed, args.stations, args.name_bytes, args.shared_prefix, args.zipf)
+        for name in args.backends:
+            backend = onebrc.BACKENDS[name]
+            if not backend.available():
+                print(f"{name}: not available, skipped")
+                continue
+            for workers in worker_counts(cpu_count) if args.scaling else [cpu_count]:
+                result : Dict[str, Any] = {
+                    "records": records,
+                    "dataset": dataset_label(args.stations, args.name_bytes, args.shared_prefix, args.zipf),
+                    "backend": name,
+                    "workers": workers,
+                    "executor": "threads" if onebrc.backends.use_threads(backend, args.executor) else "processes",
+                    "cache": "cold" if args.cold else "cached",
+                }
+                result.update(summarize(time_runs(file_path, backend, workers, args.repeat, args.cold, args.executor), records))
+                results.append(result)
+                print(
+                    f"{result_key(result):>64}: median {result['median']:7.3f} s  p95 {result['p95']:7.3f} s"
+                    f"  {result['rows_per_s'] / 1e6:7.2f} M rows/s"
+                )
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"host": platform.node(), "cpu_count": cpu_count, "python": platform.python_version(), "results": results}, file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print("Regression:", regression)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import ctypes
+import os
+from typing import Dict, Optional
+
+from stations import City
+from wire import decode_results
+
+# The shared library built from citytemp.c by `make`.
+library_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "libcitytemp.so")
+
+# Initial size of the buffer process_range writes a chunk result into. A result that doesn't fit
+# makes process_chunk parse the chunk again with a buffer of the size reported by the library.
+buffer_size = 1024 * 1024
+
+_library : Optional[ctypes.CDLL] = None
+_buffer : Optional[ctypes.Array[ctypes.c_char]] = None
+
+def load_library() -> Optional[ctypes.CDLL]:
+    """
+    Load libcitytemp.so once per process.
+    Returns:
+        Optional[ctypes.CDLL]: The library, or None if it hasn't been built.
+    """
+    global _library
+    if _library is None and os.path.exists(library_path):
+        library = ctypes.CDLL(library_path, use_errno=True)
+        library.process_range.argtypes = [ctypes.c_char_p, ctypes.c_long, ctypes.c_long, ctypes.c_char_p, ctypes.c_long]
+        library.process_range.restype = ctypes.c_long
+        _library = library
+    return _library
+
+def available() -> bool:
+    """
+    Returns:
+        bool: True when the C engine can be used, i.e. libcitytemp.so has been built.
+    """
+    return load_library() is not None
+
+def process_chunk(chunk_start: int, chunk_end: int, file_path: str) -> Dict[bytes, City]:
+    """
+    Process a chunk of the file with `process_range` of libcitytemp.so.
+    Args:
+        chunk_start (int): The start position of the chunk, at the start of a line (see `splitter.split_file`).
+        chunk_end (int): The end position of the chunk, right after a newline or at the end of the file.
+        file_path (str): The measurements file.
+    Returns:
+        Dict[bytes, City]: A dictionary with location as key and a City class with min, max, sum, and
+            count in integer tenths of a degree as value.
+    """
+    global _buffer
+    library = load_library()
+    if library is None:
+        raise FileNotFoundError(f"{library_path} not found, build it with make")
+    print("Start:", chunk_start, " End:", chunk_end)
+    if _buffer is None:
+        _buffer = ctypes.create_string_buffer(buffer_size)
+    while True:
+        size = library.process_range(file_path.encode(), chunk_start, chunk_end, _buffer, len(_buffer))
+        if size < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), file_path)
+        if size <= len(_buffer):
+            return decode_results(_buffer.raw[:size])
+        _buffer = ctypes.create_string_buffer(size)
@@ -0,0 +1,217 @@
+/*
+ * Native chunk kernel for the "cext" engine of py_1brc_final.py, loaded by cext_chunk.py through
+ * ctypes. Build with `make`.
+ *
+ * process_range aggregates the lines of one chunk of the measurements file in integer tenths of a
+ * degree and writes the result into a caller provided buffer in the layout of wire.py, so the
+ * parent merges it like the result of any other engine.
+ */
+#include <errno.h>
+#include <fcntl.h>
+#include <stdint.h>
+#include <stdlib.h>
+#include <string.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+
+/* Header of wire.py: struct "<cII", the record typecode, number of stations, size of the names. */
+#define HEADER_SIZE 9
+#define RECORD_SIZE (4 * sizeof(int64_t))
+#define INITIAL_CAPACITY 1024
+
+typedef struct {
+    const char *name; /* points into the mapping, NULL for an empty slot */
+    uint32_t length;
+    uint32_t hash;
+    int64_t min;
+    int64_t max;
+    int64_t sum;
+    int64_t count;
+} Station;
+
+typedef struct {
+    Station *slots;
+    size_t mask;
+    size_t size;
+} Table;
+
+static uint32_t hash_name(const char *name, size_t length) {
+    uint32_t hash = 2166136261u; /* FNV-1a, as in stations.py */
+    for (size_t i = 0; i < length; i++) {
+        hash = (hash ^ (unsigned char)name[i]) * 16777619u;
+    }
+    return hash;
+}
+
+static int table_grow(Table *table) {
+    size_t capacity = table->slots ? (table->mask + 1) * 2 : INITIAL_CAPACITY;
+    Station *slots = calloc(capacity, sizeof(Station));
+    if (slots == NULL) {
+        return -1;
+    }
+    if (table->slots) {
+        for (size_t i = 0; i <= table->mask; i++) {
+            Station *station = &table->slots[i];
+            if (station->name) {
+                size_t slot = station->hash & (capacity - 1);
+                while (slots[slot].name) {
+                    slot = (slot + 1) & (capacity - 1);
+                }
+                slots[slot] = *station;
+            }
+        }
+        free(table->slots);
+    }
+    table->slots = slots;
+    table->mask = capacity - 1;
+    return 0;
+}
+
+/* Find the station, inserting it if it is new. Returns NULL when out of memory. */
+static Station *table_find(Table *table, const char *name, uint32_t length) {
+    uint32_t hash = hash_name(name, length);
+    size_t slot = hash & table->mask;
+    for (;;) {
+        Station *station = &table->slots[slot];
+        if (station->name == NULL) {
+            if ((table->size + 1) * 2 > table->mask + 1) {
+                if (table_grow(table) != 0) {
+                    return NULL;
+                }
+                return table_find(table, name, length);
+            }
+            station->name = name;
+            station->length = length;
+            station->hash = hash;
+            station->min = INT64_MAX;
+            station->max = INT64_MIN;
+            table->size++;
+            return station;
+        }
+        if (station->hash == hash && station->length == length && memcmp(station->name, name, length) == 0) {
+            return station;
+        }
+        slot = (slot + 1) & table->mask;
+    }
+}
+
+static void put_u32(char *out, uint32_t value) {
+    out[0] = (char)(value & 0xff);
+    out[1] = (char)((value >> 8) & 0xff);
+    out[2] = (char)((value >> 16) & 0xff);
+    out[3] = (char)((value >> 24) & 0xff);
+}
+
+/* Write the table in the layout of wire.encode_results. Returns the size the result needs. */
+static long write_results(const Table *table, char *buf, long buf_size) {
+    size_t names_size = 0;
+    for (size_t i = 0; i <= table->mask; i++) {
+        if (table->slots[i].name) {
+            names_size += table->slots[i].length + 1;
+        }
+    }
+    if (names_size) {
+        names_size--; /* names are joined, not terminated, by newlines */
+    }
+    long required = (long)(HEADER_SIZE + names_size + table->size * RECORD_SIZE);
+    if (required > buf_size) {
+        return required;
+    }
+    buf[0] = 'q';
+    put_u32(buf + 1, (uint32_t)table->size);
+    put_u32(buf + 5, (uint32_t)names_size);
+    char *names = buf + HEADER_SIZE;
+    char *records = names + names_size;
+    for (size_t i = 0; i <= table->mask; i++) {
+        const Station *station = &table->slots[i];
+        if (station->name == NULL) {
+            continue;
+        }
+        if (names != buf + HEADER_SIZE) {
+            *names++ = '\n';
+        }
+        memcpy(names, station->name, station->length);
+        names += station->length;
+        int64_t record[4] = {station->min, station->max, station->sum, station->count};
+        memcpy(records, record, RECORD_SIZE);
+        records += RECORD_SIZE;
+    }
+    return required;
+}
+
+/*
+ * Aggregate the lines in [start, end) of the file at path, where start is the start of a line and
+ * end is right after a newline or the end of the file (see splitter.split_file).
+ *
+ * Returns the size of the result. The result is only written when it fits into buf_size bytes, so
+ * a caller seeing a larger return value retries with a larger buffer. Returns -1 with errno set
+ * when the file can't be read.
+ */
+long process_range(const char *path, long start, long end, char *buf, long buf_size) {
+    Table table = {NULL, 0, 0};
+    if (table_grow(&table) != 0) {
+        return -1;
+    }
+    long result = -1;
+    int fd = open(path, O_RDONLY);
+    if (fd == -1) {
+        goto done;
+    }
+    long page_size = sysconf(_SC_PAGESIZE);
+    long offset = start - start % page_size;
+    size_t length = (size_t)(end - offset);
+    char *mapping = NULL;
+    if (end > start) {
+        mapping = mmap(NULL, length, PROT_READ, MAP_PRIVATE, fd, offset);
+        if (mapping == MAP_FAILED) {
+            close(fd);
+            goto done;
+        }
+#ifdef MADV_SEQUENTIAL
+        madvise(mapping, length, MADV_SEQUENTIAL);
+#endif
+    }
+    close(fd);
+
+    const char *position = mapping + (start - offset);
+    const char *chunk_end = mapping + length;
+    while (position < chunk_end) {
+        const char *semicolon = memchr(position, ';', (size_t)(chunk_end - position));
+        if (semicolon == NULL) {
+            break;
+        }
+        const char *temp = semicolon + 1;
+        int negative = *temp == '-';
+        temp += negative;
+        int64_t value;
+        if (temp[1] == '.') {
+            value = (temp[0] - '0') * 10 + (temp[2] - '0');
+            temp += 3;
+        } else {
+            value = (temp[0] - '0') * 100 + (temp[1] - '0') * 10 + (temp[3] - '0');
+            temp += 4;
+        }
+        if (negative) {
+            value = -value;
+        }
+        Station *station = table_find(&table, position, (uint32_t)(semicolon - position));
+        if (station == NULL) {
+            munmap(mapping, length);
+            errno = ENOMEM;
+            goto done;
+        }
+        if (value < station->min) station->min = value;
+        if (value > station->max) station->max = value;
+        station->sum += value;
+        station->count++;
+        position = temp + 1; /* skip the newline */
+    }
+    result = write_results(&table, buf, buf_size);
+    if (mapping) {
+        munmap(mapping, length);
+    }
+done:
+    free(table.slots);
+    return result;
+}
@@ -0,0 +1,199 @@
+import mmap
+from typing import Dict, List, Sequence, Tuple, Union
+
+import numpy as np
+
+import numpy_chunk
+from splitter import mmap_window
+from stations import City
+
+# One bucket per tenth of a degree from -99.9 to 99.9, the range of the challenge.
+BUCKETS = 1999
+OFFSET = 999
+
+# The temperature of every bucket in tenths.
+TENTHS = np.arange(-OFFSET, BUCKETS - OFFSET, dtype=np.int64)
+
+# The histograms of a chunk as built and sent back by a worker: the station names, and the flat index
+# (station * BUCKETS + bucket) and count of every non-empty bucket. Its size is bounded by the number
+# of rows of the chunk, where a dense matrix would grow with the number of stations. Only the parent
+# merges them into the dense matrix of `Histograms`.
+Sparse = Tuple[List[bytes], np.ndarray, np.ndarray]
+
+class Histograms:
+    """
+    Exact per station histograms of the temperatures, as the rows of one int64 matrix. Histograms
+    merge by adding their counts, so a merge is one vectorized addition per chunk, and min, max, mean
+    and any percentile are computed from the counts alone.
+    """
+    def __init__(self) -> None:
+        self.rows : Dict[bytes, int] = dict()
+        self.counts = np.zeros((16, BUCKETS), dtype=np.int64)
+
+    def row(self, name: bytes) -> int:
+        """
+        Returns:
+            int: The row of a station, added with an empty histogram if it is new.
+        """
+        row = self.rows.get(name)
+        if row is None:
+            row = self.rows[name] = len(self.rows)
+            if row == len(self.counts):
+                self.counts = np.concatenate((self.counts, np.zeros_like(self.counts)))
+        return row
+
+    def add(self, sparse: Sparse) -> None:
+        """
+        Add sparse histograms, e.g. the result of `process_chunk`.
+        Args:
+            sparse (Sparse): The names, and the flat index and count of every non-empty bucket, each
+                index occurring once.
+        """
+        names, cells, counts = sparse
+        if not len(cells):
+            return
+        rows = np.array([self.row(name) for name in names], dtype=np.int64)
+        flat = self.counts.reshape(-1)
+        flat[rows[cells // BUCKETS] * BUCKETS + cells % BUCKETS] += counts
+
+    def sparse(self) -> Sparse:
+        """
+        Returns:
+            Sparse: The histograms in the form `add` takes.
+        """
+        counts = self.counts[:len(self.rows)].reshape(-1)
+        cells = np.flatnonzero(counts)
+        return list(self.rows), cells, counts[cells]
+
+    def aggregates(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns:
+            Tuple[np.ndarray, ...]: The min, max, sum and count of every row, in tenths of a degree.
+        """
+        counts = self.counts[:len(self.rows)]
+        mins = (counts != 0).argmax(axis=1) - OFFSET
+        maxs = BUCKETS - 1 - OFFSET - (counts[:, ::-1] != 0).argmax(axis=1)
+        return mins, maxs, counts @ TENTHS, counts.sum(axis=1)
+
+    def to_dict(self) -> Dict[bytes, City]:
+        """
+        Returns:
+            Dict[bytes, City]: The min, max, sum and count of every station in tenths, like the numpy engine.
+        """
+        mins, maxs, sums, totals = (column.tolist() for column in self.aggregates())
+        return {name: City(mins[row], maxs[row], sums[row], totals[row]) for name, row in self.rows.items()}
+
+    def percentiles(self, percentiles: Sequence[float]) -> Dict[bytes, List[int]]:
+        """
+        Compute percentiles of every station from its histogram. A percentile is the smallest
+        measurement with at least that percentage of the measurements at or below it (the nearest rank
+        method), so it is exact and always one of the measurements.
+        Args:
+            percentiles (Sequence[float]): The percentiles, from 0 to 100.
+        Returns:
+            Dict[bytes, List[int]]: The percentiles of every station, in tenths of a degree.
+        """
+        cumulative = self.counts[:len(self.rows)].cumsum(axis=1)
+        columns = []
+        for percentile in percentiles:
+            ranks = np.maximum(np.ceil(cumulative[:, -1] * (percentile / 100)), 1)
+            columns.append(((cumulative >= ranks[:, None]).argmax(axis=1) - OFFSET).tolist())
+        return {name: [column[row] for column in columns] for name, row in self.rows.items()}
+
+def process_block(block: np.ndarray) -> Sparse:
+    """
+    Build the sparse histograms of a block of complete lines.
+    Args:
+        block (np.ndarray): The uint8 block.
+    Returns:
+        Sparse: The histograms of every station in the block, indexed by its ID in the block.
+    """
+    starts, semicolons, temps, ids, first = numpy_chunk.parse_block(block)
+    cells = ids * BUCKETS + (temps.astype(np.int64) + OFFSET)
+    if len(first) * BUCKETS <= 4 * len(cells):
+        # Few stations for the rows: count into a dense vector rather than sorting the rows.
+        counts = np.bincount(cells, minlength=len(first) * BUCKETS)
+        cells = np.flatnonzero(counts)
+        counts = counts[cells]
+    else:
+        cells, counts = np.unique(cells, return_counts=True)
+    names = [block[starts[row]:semicolons[row]].tobytes() for row in first.tolist()]
+    return names, cells, counts
+
+def combine(cells: List[np.ndarray], counts: List[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Add up the counts of cells that occur more than once.
+    Args:
+        cells (List[np.ndarray]): Flat indexes, in the same station numbering.
+        counts (List[np.ndarray]): The count of each index.
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The sorted distinct indexes and their total counts.
+    """
+    all_cells, all_counts = np.concatenate(cells), np.concatenate(counts)
+    if not len(all_cells):
+        return all_cells, all_counts
+    order = np.argsort(all_cells, kind="stable")
+    all_cells, all_counts = all_cells[order], all_counts[order]
+    firsts = np.flatnonzero(np.concatenate(([True], all_cells[1:] != all_cells[:-1])))
+    return all_cells[firsts], np.add.reduceat(all_counts, firsts)
+
+def process_range(mm: Union[mmap.mmap, bytes], position: int, end: int) -> Sparse:
+    """
+    Build the histograms of a range of a memory-mapped file, see `numpy_chunk.process_range`. The
+    blocks are renumbered to IDs local to the range and their cells combined once those added since
+    the last combine outnumber it, so memory follows the non-empty buckets rather than a dense matrix.
+    Args:
+        mm (Union[mmap.mmap, bytes]): The memory-mapped file, or a buffer of lines.
+        position (int): The start of the range, at the start of a line.
+        end (int): The end of the range, right after a newline or at the end of the file.
+    Returns:
+        Sparse: The histograms of every station in the range.
+    """
+    stations : Dict[bytes, int] = dict()
+    cells : List[np.ndarray] = [np.zeros(0, dtype=np.int64)]
+    counts : List[np.ndarray] = [np.zeros(0, dtype=np.int64)]
+    pending = 0  # Cells added since the last combine.
+    for block in numpy_chunk.iter_blocks(mm, position, numpy_chunk.block_size, end):
+        names, block_cells, block_counts = process_block(block)
+        del block
+        mapping = np.array([stations.setdefault(name, len(stations)) for name in names], dtype=np.int64)
+        cells.append(mapping[block_cells // BUCKETS] * BUCKETS + block_cells % BUCKETS)
+        counts.append(block_counts.astype(np.int64))
+        pending += len(block_cells)
+        if pending > len(cells[0]):
+            combined_cells, combined_counts = combine(cells, counts)
+            cells, counts, pending = [combined_cells], [combined_counts], 0
+    combined_cells, combined_counts = combine(cells, counts)
+    return list(stations), combined_cells, combined_counts
+
+def process_chunk(chunk_start: int, chunk_end: int, file_path: str) -> Sparse:
+    """
+    Build the histograms of a chunk of the file in a worker.
+    Args:
+        chunk_start (int): The start position of the chunk, at the start of a line (see `splitter.split_file`).
+        chunk_end (int): The end position of the chunk, right after a newline or at the end of the file.
+        file_path (str): The path of the measurements file.
+    Returns:
+        Sparse: The histograms of every station in the chunk.
+    """
+    offset, length, position = mmap_window(chunk_start, chunk_end)
+    with open(file_path, "rb") as file:
+        mm = mmap.mmap(file.fileno(), length=length, access=mmap.ACCESS_READ, offset=offset)
+        sparse = process_range(mm, position, length)
+        mm.close()
+        return sparse
+
+def print_stats(histograms: Histograms, percentiles: Sequence[float]) -> None:
+    """
+    Print `{station=min/mean/max/p50/p95/p99, ...}` sorted by station, with the requested percentiles.
+    Args:
+        histograms (Histograms): The merged histograms.
+        percentiles (Sequence[float]): The percentiles to print, see `Histograms.percentiles`.
+    """
+    values = histograms.percentiles(percentiles)
+    print("{", end="")
+    for location, measurements in sorted(histograms.to_dict().items()):
+        columns = [measurements.min / 10, measurements.sum / (measurements.count * 10), measurements.max / 10]
+        columns += [value / 10 for value in values[location]]
+        print(f"{location.decode('utf8')}=" + "/".join(f"{column:.1f}" for column in columns), end=", ")
+    print("\b\b} ")
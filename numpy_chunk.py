@@ -0,0 +1,216 @@
+import mmap
+from typing import Dict, Iterator, Tuple, Union
+
+import numpy as np
+
+from stations import City
+from splitter import mmap_window
+
+# Size of the slices of the chunk that get vectorized at once. Each block needs a few
+# arrays with one entry per row plus a rows x name length byte matrix, so this bounds memory.
+block_size = 16 * 1024 * 1024
+
+# Multiplier for the hash over the 8 byte words of a station name (any large odd constant).
+HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+# Bits of the direct-mapped table that deduplicates station hashes within a block.
+TABLE_BITS = 22
+
+# WORD_MASKS[n] keeps the low n bytes of a little endian 8 byte word.
+WORD_MASKS = np.array([(1 << (8 * n)) - 1 for n in range(9)], dtype=np.uint64)
+
+def iter_blocks(mm: Union[mmap.mmap, bytes], position: int, block_size: int, end: int = 0) -> Iterator[np.ndarray]:
+    """
+    Split the memory-mapped chunk into NumPy views that end on a line boundary.
+    Args:
+        mm (Union[mmap.mmap, bytes]): The memory-mapped chunk, or a buffer of lines.
+        position (int): The position to start from, must be the start of a line.
+        block_size (int): The target size of each block. A block is cut at the last newline inside it,
+            and only grows beyond block_size when a single line is longer than a block.
+        end (int): The position to stop at, right after a newline or at the end of the file, 0 for
+            the end of the mapping.
+    Returns:
+        Iterator[np.ndarray]: uint8 views over complete lines. The last one may lack the trailing newline.
+    """
+    data = np.frombuffer(mm, dtype=np.uint8)
+    size = end or len(mm)
+    while position < size:
+        block_end = mm.rfind(b"\n", position, min(position + block_size, size)) + 1
+        if block_end <= position:
+            block_end = mm.find(b"\n", position + block_size, size) + 1 or size
+        yield data[position:block_end]
+        position = block_end
+
+def parse_temps(block: np.ndarray, semicolons: np.ndarray, newlines: np.ndarray) -> np.ndarray:
+    """
+    Parse all temperatures of a block into integer tenths with array arithmetic.
+    Args:
+        block (np.ndarray): The uint8 block.
+        semicolons (np.ndarray): The position of the `;` on each line.
+        newlines (np.ndarray): The position of the newline ending each line.
+    Returns:
+        np.ndarray: The int16 temperatures in tenths of a degree.
+    """
+    negative = block[semicolons + 1] == 45  # ASCII for "-"
+    digits = (newlines - semicolons - 1) - negative  # 3 for #.# and 4 for ##.#
+    tenths = block[newlines - 1].astype(np.int16) - 48
+    units = block[newlines - 3].astype(np.int16) - 48
+    tens = np.where(digits == 4, block[newlines - 4].astype(np.int16) - 48, 0)
+    temps = tens * 100 + units * 10 + tenths
+    return np.where(negative, -temps, temps).astype(np.int16)
+
+def name_words(block: np.ndarray, starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """
+    Gather the station name of each line as zero padded little endian 8 byte words.
+    Args:
+        block (np.ndarray): The uint8 block.
+        starts (np.ndarray): The position of the start of each line.
+        lengths (np.ndarray): The length of the station name of each line.
+    Returns:
+        np.ndarray: A rows x words uint64 matrix.
+    """
+    padded = np.zeros(len(block) + 8, dtype=np.uint8)
+    padded[:len(block)] = block
+    windows = np.lib.stride_tricks.sliding_window_view(padded, 8)
+    words = np.empty((len(starts), (int(lengths.max()) + 7) // 8), dtype=np.uint64)
+    for column in range(words.shape[1]):
+        remaining = np.clip(lengths - column * 8, 0, 8)
+        offsets = np.minimum(starts + column * 8, len(block))
+        words[:, column] = windows[offsets].view(np.uint64).ravel() & WORD_MASKS[remaining]
+    return words
+
+def unique_rows(words: np.ndarray, hashes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Deduplicate rows by sorting their hashes, falling back to sorting the rows themselves on a collision.
+    Args:
+        words (np.ndarray): The rows x words name matrix.
+        hashes (np.ndarray): The hash of each row.
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The ID of each row, and the index of one row per ID.
+    """
+    _, first, ids = np.unique(hashes, return_index=True, return_inverse=True)
+    ids = ids.ravel()
+    if not (words == words[first[ids]]).all():
+        rows = np.ascontiguousarray(words).view(np.dtype((np.void, words.shape[1] * 8))).ravel()
+        _, first, ids = np.unique(rows, return_index=True, return_inverse=True)
+        ids = ids.ravel()
+    return ids, first
+
+def station_ids(block: np.ndarray, starts: np.ndarray, semicolons: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Map the station name of each line to a dense integer ID.
+    Each name is hashed into a direct-mapped table that picks one representative line per bucket,
+    which avoids sorting all rows. Every line is compared against its representative, and only the
+    lines of stations that collided in the table are deduplicated by sorting.
+    Args:
+        block (np.ndarray): The uint8 block.
+        starts (np.ndarray): The position of the start of each line.
+        semicolons (np.ndarray): The position of the `;` on each line.
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The ID of each line, and the index of one line per ID.
+    """
+    words = name_words(block, starts, semicolons - starts)
+    hashes = words[:, 0] * HASH_MULTIPLIER
+    for column in range(1, words.shape[1]):
+        hashes ^= words[:, column]
+        hashes *= HASH_MULTIPLIER
+    buckets = (hashes >> np.uint64(64 - TABLE_BITS)).astype(np.intp)
+    rows = np.arange(len(starts))
+    table = np.empty(1 << TABLE_BITS, dtype=np.intp)
+    table[buckets] = rows
+    representatives = table[buckets]
+    first = np.flatnonzero(representatives == rows)
+    ids = np.empty(len(starts), dtype=np.intp)
+    ids[first] = np.arange(len(first))
+    ids = ids[representatives]
+    collided = np.flatnonzero((words != words[representatives]).any(axis=1))
+    if len(collided):
+        collided_ids, collided_first = unique_rows(words[collided], hashes[collided])
+        ids[collided] = collided_ids + len(first)
+        first = np.concatenate((first, collided[collided_first]))
+    return ids, first
+
+def parse_block(block: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Parse a block of complete lines into one station ID and temperature per line.
+    Args:
+        block (np.ndarray): The uint8 block.
+    Returns:
+        Tuple[np.ndarray, ...]: The position of the start and of the `;` of each line, its int16
+            temperature in tenths, its station ID, and the index of one line per ID (see `station_ids`).
+    """
+    newlines = np.flatnonzero(block == 10)
+    if len(block) and block[-1] != 10:
+        newlines = np.append(newlines, len(block))
+    starts = np.empty_like(newlines)
+    starts[0] = 0
+    starts[1:] = newlines[:-1] + 1
+    semicolons = np.flatnonzero(block == 59)  # ASCII for ";"
+    temps = parse_temps(block, semicolons, newlines)
+    ids, first = station_ids(block, starts, semicolons)
+    return starts, semicolons, temps, ids, first
+
+def process_block(block: np.ndarray, result: Dict[bytes, City]) -> None:
+    """
+    Aggregate a block of complete lines into the per location results.
+    Args:
+        block (np.ndarray): The uint8 block.
+        result (Dict[bytes, City]): The results to fold the block into.
+    """
+    starts, semicolons, temps, ids, first = parse_block(block)
+    stations = len(first)
+    counts = np.bincount(ids, minlength=stations)
+    sums = np.bincount(ids, weights=temps, minlength=stations).astype(np.int64)
+    mins = np.full(stations, np.iinfo(np.int16).max, dtype=np.int16)
+    np.minimum.at(mins, ids, temps)
+    maxs = np.full(stations, np.iinfo(np.int16).min, dtype=np.int16)
+    np.maximum.at(maxs, ids, temps)
+    for row, _min, _max, _sum, count in zip(first.tolist(), mins.tolist(), maxs.tolist(), sums.tolist(), counts.tolist()):
+        location = block[starts[row]:semicolons[row]].tobytes()
+        _result = result.get(location)
+        if _result is None:
+            result[location] = City(_min, _max, _sum, count)
+        else:
+            if _min < _result.min:
+                _result.min = _min
+            if _max > _result.max:
+                _result.max = _max
+            _result.sum += _sum
+            _result.count += count
+
+def process_range(mm: Union[mmap.mmap, bytes], position: int, end: int) -> Dict[bytes, City]:
+    """
+    Aggregate a range of a memory-mapped file with NumPy. Only reads from explicit positions, so threads
+    can share one mapping, and NumPy releases the GIL for most of the work.
+    Args:
+        mm (Union[mmap.mmap, bytes]): The memory-mapped file, or a buffer of lines.
+        position (int): The start of the range, at the start of a line.
+        end (int): The end of the range, right after a newline or at the end of the file.
+    Returns:
+        Dict[bytes, City]: A dictionary with location as key and a City class with min, max, sum, and count as value.
+    """
+    result : Dict[bytes, City] = dict()
+    for block in iter_blocks(mm, position, block_size, end):
+        process_block(block, result)
+        # The mmap can't be closed while a NumPy view of it is still alive.
+        del block
+    return result
+
+def process_chunk(chunk_start: int, chunk_end: int, file_path: str) -> Dict[bytes, City]:
+    """
+    Process a chunk of the file with NumPy and compute min, max, sum, and count of measurements for each location.
+    The aggregates are integer tenths of a degree, the same as `py_1brc_final.process_chunk` in fixed point mode.
+    Args:
+        chunk_start (int): The start position of the chunk, at the start of a line (see `splitter.split_file`).
+        chunk_end (int): The end position of the chunk, right after a newline or at the end of the file.
+        file_path (str): The path of the measurements file.
+    Returns:
+        Dict[bytes, City]: A dictionary with location as key and a City class with min, max, sum, and count as value.
+    """
+    offset, length, position = mmap_window(chunk_start, chunk_end)
+    print("Start:", chunk_start, " End:", chunk_end)
+    with open(file_path, "r+b") as file:
+        mm = mmap.mmap(file.fileno(), length=length, access=mmap.ACCESS_READ, offset=offset)
+        result = process_range(mm, position, length)
+        mm.close()
+        return result
@@ -0,0 +1,20 @@
+from typing import TYPE_CHECKING, Any
+
+from onebrc.backends import BACKENDS, Backend, input_files, register, resolve, run, run_files
+
+if TYPE_CHECKING:
+    from onebrc.api import Aggregator, Stats, aggregate
+    from onebrc.query import summarize
+    from onebrc.stats import run_stats
+
+__all__ = ["Aggregator", "BACKENDS", "Backend", "Stats", "aggregate", "input_files", "register", "resolve", "run", "run_files", "run_stats", "summarize"]
+
+# Names imported on first use, so `python -m onebrc.<module>` doesn't find its own module imported by
+# the package already, and the package imports without numpy.
+_lazy = {"Aggregator": "onebrc.api", "Stats": "onebrc.api", "aggregate": "onebrc.api", "run_stats": "onebrc.stats", "summarize": "onebrc.query"}
+
+def __getattr__(name: str) -> Any:
+    if name in _lazy:
+        import importlib
+        return getattr(importlib.import_module(_lazy[name]), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
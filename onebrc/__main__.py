@@ -0,0 +1,122 @@
+import argparse
+import os
+import sys
+from typing import List, Optional
+
+import py_1brc_final
+from onebrc.backends import BACKENDS, input_files, resolve, run, run_files
+from onebrc import cache
+from onebrc.checkpoint import run_incremental
+from onebrc.compressed import compression, run_compressed
+from onebrc.follow import follow
+from onebrc.query import summarize
+from onebrc.stats import default_percentiles, run_stats
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Aggregate a measurements file with the selected backend and print `{station=min/mean/max, ...}`."""
+    parser = argparse.ArgumentParser(prog="python -m onebrc", description="One billion row challenge")
+    parser.add_argument("file_path", nargs="?", default="measurements.txt",
+                        help="The measurements file, a directory of *.txt shards, or a glob such as 'shards/measurements-*.txt'")
+    parser.add_argument("-b", "--backend", choices=list(BACKENDS), default="pure", help="The chunk processing backend")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="Number of worker processes or threads, defaults to the number of CPUs")
+    parser.add_argument("-c", "--chunk-size", type=int, default=py_1brc_final.segment_size, help="Chunk size in bytes, 0 for one chunk per worker")
+    parser.add_argument("-m", "--merge", choices=["stream", "tree"], default="stream", help="How chunk results are merged")
+    parser.add_argument("-e", "--executor", choices=["auto", "processes", "threads"], default="auto",
+                        help="Run chunks in worker processes or in threads sharing one mmap, auto picks threads when the GIL is disabled")
+    parser.add_argument("--checkpoint", help="Resume from this checkpoint file and only process the rows appended since, then update it")
+    parser.add_argument("--follow", action="store_true",
+                        help="Keep aggregating lines as they are appended and print the results at every snapshot, until interrupted")
+    parser.add_argument("--interval", type=float, default=10, help="With --follow, seconds between snapshots, 0 for none")
+    parser.add_argument("--rows", type=int, default=0, help="With --follow, also snapshot after this many new rows")
+    parser.add_argument("--per-file", action="store_true", help="Also print the results of every file before the overall results")
+    parser.add_argument("--stats", action="store_true",
+                        help="Print min/mean/max/percentiles from exact per station histograms, built by the numpy engine whatever the backend")
+    parser.add_argument("--percentiles", type=float, nargs="+", default=default_percentiles, help="The percentiles printed by --stats")
+    parser.add_argument("--index", action="store_true", help="Aggregate from the columnar sidecar <file_path>.idx built by python -m onebrc.index")
+    parser.add_argument("--stations", nargs="+", help="Only aggregate these stations, skipping the lines of the others before parsing them")
+    parser.add_argument("--prefix", nargs="+", help="Only aggregate the stations whose name starts with one of these")
+    parser.add_argument("--no-cache", action="store_true", help=f"Neither read nor write the result cache in {cache.cache_dir}")
+    parser.add_argument("--cache-hash", action="store_true", help="Also key the result cache on a hash of sampled blocks of the file contents")
+    parser.add_argument("--list-backends", action="store_true", help="List the backends and whether they can run here")
+    args = parser.parse_args(argv)
+
+    if args.list_backends:
+        for name, backend in BACKENDS.items():
+            threads = ", threads" if backend.range_task is not None else ""
+            print(f"{name:>8}: {backend.description}{threads}{'' if backend.available() else ' (not available)'}")
+        return
+    try:
+        file_paths = input_files(args.file_path)
+    except FileNotFoundError as error:
+        parser.error(str(error))
+    if file_paths == [args.file_path] and not os.path.isfile(args.file_path):
+        parser.error(f"{args.file_path} not found")
+    if (args.follow or args.checkpoint) and file_paths != [args.file_path]:
+        parser.error("--follow and --checkpoint take a single file")
+    stations = [station.encode() for station in args.stations or []]
+    prefixes = [prefix.encode() for prefix in args.prefix or []]
+    if args.index or stations or prefixes:
+        if args.follow or args.checkpoint or args.stats or file_paths != [args.file_path]:
+            parser.error("--index, --stations and --prefix take a single file and can't be combined with --follow, --checkpoint or --stats")
+    if (stations or prefixes) and not args.index:
+        py_1brc_final.print_results(summarize(args.file_path, args.stations or [], args.prefix or [], args.workers, args.chunk_size), True)
+        return
+    if args.index:
+        from onebrc.index import ColumnarIndex, index_path
+        try:
+            with ColumnarIndex(index_path(args.file_path), args.file_path) as index:
+                shared_results = index.aggregate(index.select(stations, prefixes) if stations or prefixes else None)
+        except FileNotFoundError:
+            parser.error(f"{index_path(args.file_path)} not found, build it with python -m onebrc.index {args.file_path}")
+        except ValueError as error:
+            parser.error(f"{error}, rebuild it with python -m onebrc.index {args.file_path}")
+        py_1brc_final.print_results(shared_results, True)
+        return
+    kind = compression(args.file_path) if file_paths == [args.file_path] and os.path.isfile(args.file_path) else None
+    if kind and (args.follow or args.checkpoint or args.stats):
+        parser.error("--follow, --checkpoint and --stats take an uncompressed file")
+    if args.stats and (args.follow or args.checkpoint):
+        parser.error("--stats can't be combined with --follow or --checkpoint")
+    if args.stats:
+        import histograms
+        histograms.print_stats(run_stats(file_paths, args.workers, args.chunk_size), args.percentiles)
+        return
+    backend = resolve(args.backend)
+    if backend.name != args.backend:
+        print(f"Backend {args.backend!r} is not available on this host, falling back to 'pure'")
+    if kind and backend.range_task is None:
+        print(f"Backend {backend.name!r} can't parse decompressed blocks, falling back to 'pure'")
+        backend = BACKENDS["pure"]
+    if args.follow:
+        # The backend catches up on the rows already in the file, then appended rows are parsed in process.
+        if args.checkpoint:
+            py_1brc_final.print_results(run_incremental(args.checkpoint, args.file_path, backend, args.workers, args.chunk_size, args.executor), backend.tenths)
+        try:
+            for shared_results in follow(args.file_path, args.interval, args.rows, backend.tenths, args.checkpoint):
+                py_1brc_final.print_results(shared_results, backend.tenths)
+                sys.stdout.flush()
+        except KeyboardInterrupt:
+            pass
+        return
+    # Incremental runs have their own state, and per file results aren't cached.
+    key = None if args.no_cache or args.checkpoint or args.per_file else cache.cache_key(file_paths, backend.tenths, args.cache_hash)
+    cached = cache.load(key) if key else None
+    if cached is not None:
+        shared_results = cached
+    elif kind:
+        shared_results = run_compressed(args.file_path, backend, args.workers)
+    elif file_paths != [args.file_path] or args.per_file:
+        shared_results, file_results = run_files(file_paths, backend, args.workers, args.chunk_size, args.executor, args.per_file)
+        for file_path, results in file_results.items():
+            print(f"{file_path}:")
+            py_1brc_final.print_results(results, backend.tenths)
+    elif args.checkpoint:
+        shared_results = run_incremental(args.checkpoint, args.file_path, backend, args.workers, args.chunk_size, args.executor)
+    else:
+        shared_results = run(args.file_path, backend, args.workers, args.chunk_size, args.merge, args.executor)
+    if key and cached is None:
+        cache.store(key, shared_results)
+    py_1brc_final.print_results(shared_results, backend.tenths)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,261 @@
+import atexit
+import csv
+import json
+import multiprocessing
+import multiprocessing.pool
+import os
+import struct
+import sys
+import threading
+import warnings
+from array import array
+from dataclasses import asdict, dataclass
+from types import TracebackType
+from typing import Any, BinaryIO, Dict, Mapping, Optional, Sequence, TextIO, Type
+
+import py_1brc_final
+from onebrc import cache
+from onebrc.backends import BACKENDS, input_files, resolve, run, run_files
+from onebrc.compressed import compression, run_compressed
+from onebrc.query import summarize
+from stations import City
+
+# Stream written by `write_columns`: this header, then record batches of a BATCH header (number of
+# stations and size of their names), the station names joined by newlines, and min, mean and max
+# float64 columns and a count int64 column, little endian. A batch of zero stations ends the stream.
+STREAM_HEADER = struct.Struct("<4sB")
+MAGIC = b"1BRS"
+VERSION = 1
+BATCH = struct.Struct("<II")
+
+# Stations per record batch of `write_columns`.
+batch_rows = 65536
+
+@dataclass(frozen=True)
+class Stats:
+    """The measurements of one station, in degrees."""
+    min : float
+    mean : float
+    max : float
+    count : int
+
+def to_stats(shared_results: Dict[bytes, City], tenths: bool) -> Dict[str, Stats]:
+    """
+    Convert merged results into Stats, sorted by station like the printed results.
+    Args:
+        shared_results (Dict[bytes, City]): The merged results.
+        tenths (bool): The aggregates are integer tenths of a degree rather than floats.
+    Returns:
+        Dict[str, Stats]: The min, mean, max and count of each station. The mean is not rounded.
+    """
+    scale = 10 if tenths else 1
+    return {
+        location.decode("utf8"): Stats(city.min / scale, city.sum / (city.count * scale) if city.count else 0.0, city.max / scale, city.count)
+        for location, city in sorted(shared_results.items())
+    }
+
+def quiet_worker() -> None:
+    """Drop what the chunk functions print in the workers, so it stays out of the output of the host process."""
+    sys.stdout = open(os.devnull, "w")
+
+class Aggregator:
+    """
+    Aggregate measurements files on a process pool that is started on first use and kept between calls,
+    so a long-running process pays for starting the workers once rather than on every file. Calls may
+    come from several threads, they share the pool.
+    """
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        backend: str = "numpy",
+        chunk_size: int = py_1brc_final.segment_size,
+        max_tasks_per_child: Optional[int] = None,
+    ) -> None:
+        """
+        Args:
+            workers (Optional[int]): The number of worker processes, defaults to the number of CPUs.
+            backend (str): The default backend, see `onebrc.BACKENDS`.
+            chunk_size (int): Split files into chunks of about this size, 0 for one chunk per worker.
+            max_tasks_per_child (Optional[int]): Replace a worker after this many chunks, to bound the
+                memory a worker can hold on to over a long life, None to keep the workers.
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.backend = backend
+        self.chunk_size = chunk_size
+        self.max_tasks_per_child = max_tasks_per_child
+        self._pool : Optional[multiprocessing.pool.Pool] = None
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> "Aggregator":
+        return self
+
+    def __exit__(self, exc_type: Optional[Type[BaseException]], exc: Optional[BaseException], traceback: Optional[TracebackType]) -> None:
+        self.close()
+
+    @property
+    def pool(self) -> multiprocessing.pool.Pool:
+        """The worker pool, started on first use."""
+        with self._lock:
+            if self._pool is None:
+                self._pool = multiprocessing.Pool(self.workers, quiet_worker, maxtasksperchild=self.max_tasks_per_child)
+            return self._pool
+
+    def close(self) -> None:
+        """Stop the workers. A later call starts a new pool."""
+        with self._lock:
+            if self._pool is not None:
+                self._pool.terminate()
+                self._pool.join()
+                self._pool = None
+
+    def aggregate(
+        self,
+        path: str,
+        backend: Optional[str] = None,
+        stations: Sequence[str] = (),
+        prefixes: Sequence[str] = (),
+        use_cache: bool = False,
+        executor: str = "auto",
+    ) -> Dict[str, Stats]:
+        """
+        Aggregate a measurements file, like `python -m onebrc` but returning the results.
+        Args:
+            path (str): A measurements file, which may be gzip or zstd compressed, a directory of
+                shards or a glob, see `onebrc.input_files`.
+            backend (Optional[str]): The backend, defaults to the one of the aggregator. A backend that
+                can't run on this host falls back to "pure" with a RuntimeWarning, and compressed files
+                fall back to "pure" for backends that can't parse decompressed blocks.
+            stations (Sequence[str]): Only aggregate these stations, see `onebrc.summarize`.
+            prefixes (Sequence[str]): Only aggregate the stations whose name starts with one of these.
+            use_cache (bool): Look the results up in, and add them to, the cache of `onebrc.cache`.
+            executor (str): The executor, see `onebrc.run`.
+        Returns:
+            Dict[str, Stats]: The results of each station, sorted by station.
+        Raises:
+            FileNotFoundError: No file matches path.
+            ValueError: Stations or prefixes were given for several files or a compressed file.
+        """
+        file_paths = input_files(path)
+        kind = compression(path) if file_paths == [path] else None
+        if stations or prefixes:
+            if kind or file_paths != [path]:
+                raise ValueError("stations and prefixes take a single uncompressed file")
+            return to_stats(summarize(path, stations, prefixes, self.workers, self.chunk_size, pool=self.pool), True)
+        name = backend or self.backend
+        selected = resolve(name)
+        if selected.name != name:
+            warnings.warn(f"Backend {name!r} is not available on this host, falling back to 'pure'", RuntimeWarning, stacklevel=2)
+        if kind and selected.range_task is None:
+            selected = BACKENDS["pure"]
+        key = cache.cache_key(file_paths, selected.tenths) if use_cache else None
+        shared_results = cache.load(key) if key else None
+        if shared_results is None:
+            if kind:
+                shared_results = run_compressed(path, selected, self.workers, pool=self.pool)
+            elif file_paths != [path]:
+                shared_results, _ = run_files(file_paths, selected, self.workers, self.chunk_size, executor, pool=self.pool)
+            else:
+                shared_results = run(path, selected, self.workers, self.chunk_size, executor=executor, pool=self.pool)
+            if key:
+                cache.store(key, shared_results)
+        return to_stats(shared_results, selected.tenths)
+
+# The aggregator of `aggregate`, created on its first call and stopped at exit.
+_shared : Optional[Aggregator] = None
+_shared_lock = threading.Lock()
+
+def shared_aggregator() -> Aggregator:
+    """
+    Returns:
+        Aggregator: The aggregator of the process, with one worker per CPU.
+    """
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = Aggregator()
+            atexit.register(_shared.close)
+        return _shared
+
+def aggregate(path: str, **opts: Any) -> Dict[str, Stats]:
+    """
+    Aggregate a measurements file on the warm pool of `shared_aggregator`.
+    Args:
+        path (str): The measurements file, directory or glob.
+        **opts: The options of `Aggregator.aggregate`: backend, stations, prefixes, use_cache, executor.
+    Returns:
+        Dict[str, Stats]: The results of each station, sorted by station.
+    """
+    return shared_aggregator().aggregate(path, **opts)
+
+def write_json(results: Mapping[str, Stats], file: TextIO) -> None:
+    """
+    Write `{"station": {"min": ..., "mean": ..., "max": ..., "count": ...}, ...}`, one station at a time.
+    Args:
+        results (Mapping[str, Stats]): The results of `aggregate`.
+        file (TextIO): The output.
+    """
+    file.write("{")
+    for index, (station, stats) in enumerate(results.items()):
+        file.write(("," if index else "") + json.dumps(station, ensure_ascii=False) + ":" + json.dumps(asdict(stats)))
+    file.write("}\n")
+
+def write_csv(results: Mapping[str, Stats], file: TextIO) -> None:
+    """
+    Write a `station,min,mean,max,count` header and one row per station.
+    Args:
+        results (Mapping[str, Stats]): The results of `aggregate`.
+        file (TextIO): The output, opened with `newline=""`.
+    """
+    writer = csv.writer(file)
+    writer.writerow(["station", "min", "mean", "max", "count"])
+    for station, stats in results.items():
+        writer.writerow([station, stats.min, stats.mean, stats.max, stats.count])
+
+def write_columns(results: Mapping[str, Stats], file: BinaryIO) -> None:
+    """
+    Write the results as a stream of columnar record batches of batch_rows stations, see STREAM_HEADER.
+    Args:
+        results (Mapping[str, Stats]): The results of `aggregate`.
+        file (BinaryIO): The output.
+    """
+    file.write(STREAM_HEADER.pack(MAGIC, VERSION))
+    items = list(results.items())
+    for batch_start in range(0, len(items), batch_rows):
+        batch = items[batch_start:batch_start + batch_rows]
+        names = b"\n".join(station.encode("utf8") for station, _ in batch)
+        columns = [array("d", (getattr(stats, field) for _, stats in batch)) for field in ("min", "mean", "max")]
+        columns.append(array("q", (stats.count for _, stats in batch)))
+        file.write(BATCH.pack(len(batch), len(names)) + names)
+        for column in columns:
+            if sys.byteorder == "big":
+                column.byteswap()
+            file.write(column.tobytes())
+    file.write(BATCH.pack(0, 0))
+
+def read_columns(file: BinaryIO) -> Dict[str, Stats]:
+    """
+    Read a stream written by `write_columns`.
+    Args:
+        file (BinaryIO): The input.
+    Returns:
+        Dict[str, Stats]: The results of each station.
+    Raises:
+        ValueError: The input is not such a stream.
+    """
+    magic, version = STREAM_HEADER.unpack(file.read(STREAM_HEADER.size))
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"Not a results stream of version {VERSION}")
+    results : Dict[str, Stats] = dict()
+    while True:
+        rows, names_size = BATCH.unpack(file.read(BATCH.size))
+        if not rows:
+            return results
+        names = file.read(names_size).decode("utf8").split("\n")
+        columns = []
+        for typecode in "dddq":
+            column = array(typecode, file.read(rows * 8))
+            if sys.byteorder == "big":
+                column.byteswap()
+            columns.append(column)
+        for row, name in enumerate(names):
+            results[name] = Stats(columns[0][row], columns[1][row], columns[2][row], columns[3][row])
@@ -0,0 +1,304 @@
+import contextlib
+import copy
+import glob
+import importlib.util
+import mmap
+import multiprocessing
+import multiprocessing.pool
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Any, Callable, ContextManager, Dict, List, Optional, Tuple, Union
+
+import cext_chunk
+import py_1brc_final
+from splitter import split_file
+from stations import City
+from wire import merge_encoded
+
+# The files read when the input of a run is a directory.
+directory_pattern = "*.txt"
+
+# A chunk processing function and its arguments, as run by `py_1brc_final.run_task`.
+Task = Tuple[Callable[..., Dict[bytes, City]], Tuple[Any, ...]]
+
+@dataclass(frozen=True)
+class Backend:
+    """
+    An implementation of the chunk processing step. Every backend runs on the same chunking
+    (`splitter.split_file`), merge (`merge_encoded` or `py_1brc_final.tree_merge`) and output
+    (`py_1brc_final.print_results`) code, only the function applied to each chunk differs.
+    """
+    name : str
+    description : str
+    # Build the task processing the chunk [start, end) of the file.
+    task : Callable[[str, int, int], Task]
+    # The aggregates are integer tenths of a degree rather than floats.
+    tenths : bool = False
+    # Always run on the thread executor instead of worker processes.
+    threads : bool = False
+    # Build the task processing [start, end) of a mapping of the whole file shared by all threads, or
+    # of a buffer of decompressed lines, None if the backend can't run on either.
+    range_task : Optional[Callable[[Union[mmap.mmap, bytes], int, int], Task]] = None
+    # Whether the backend can run on this host, e.g. its extension has been built.
+    available : Callable[[], bool] = lambda: True
+
+def pure_task(file_path: str, start: int, end: int) -> Task:
+    """The interpreted block parser of py_1brc_final.py, parsing temperatures with float()."""
+    return (py_1brc_final.process_chunk, (start, end, False, py_1brc_final.block_size, False, file_path))
+
+def numpy_task(file_path: str, start: int, end: int) -> Task:
+    """The vectorized engine of numpy_chunk.py."""
+    import numpy_chunk
+    return (numpy_chunk.process_chunk, (start, end, file_path))
+
+def pure_range_task(mm: Union[mmap.mmap, bytes], start: int, end: int) -> Task:
+    """The interpreted block parser of py_1brc_final.py on a shared mapping."""
+    return (py_1brc_final.process_range, (mm, start, end, False, py_1brc_final.block_size or 8 * 1024 * 1024))
+
+def numpy_range_task(mm: Union[mmap.mmap, bytes], start: int, end: int) -> Task:
+    """The vectorized engine of numpy_chunk.py on a shared mapping."""
+    import numpy_chunk
+    return (numpy_chunk.process_range, (mm, start, end))
+
+def mypyc_task(file_path: str, start: int, end: int) -> Task:
+    """The i64 kernel of process_chunk.py, compiled with mypyc."""
+    import process_chunk
+    return (process_chunk.process_chunk, (start, end, True, py_1brc_final.block_size, False, file_path))
+
+def cext_task(file_path: str, start: int, end: int) -> Task:
+    """process_range of libcitytemp.so."""
+    return (cext_chunk.process_chunk, (start, end, file_path))
+
+def mypyc_available() -> bool:
+    """
+    Returns:
+        bool: True when process_chunk.py has been compiled with mypyc.
+    """
+    import process_chunk
+    return process_chunk.compiled
+
+BACKENDS : Dict[str, Backend] = {}
+
+def register(backend: Backend) -> None:
+    """
+    Add a backend to the registry, replacing any backend of the same name.
+    Args:
+        backend (Backend): The backend.
+    """
+    BACKENDS[backend.name] = backend
+
+register(Backend("pure", "Interpreted Python", pure_task, range_task=pure_range_task))
+register(Backend("numpy", "Vectorized NumPy", numpy_task, tenths=True, range_task=numpy_range_task, available=lambda: importlib.util.find_spec("numpy") is not None))
+register(Backend("mypyc", "process_chunk.py compiled with mypyc", mypyc_task, tenths=True, available=mypyc_available))
+register(Backend("cext", "libcitytemp.so through ctypes", cext_task, tenths=True, available=cext_chunk.available))
+register(Backend("threads", "Interpreted Python, one thread per worker", pure_task, threads=True, range_task=pure_range_task))
+
+def resolve(name: str) -> Backend:
+    """
+    Look up a backend, falling back to "pure" when it can't run on this host. Nothing is printed, the
+    caller tells the fallback apart by the name of the backend returned.
+    Args:
+        name (str): The name of the backend.
+    Returns:
+        Backend: The backend to run.
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend {name!r}, choose from {', '.join(BACKENDS)}")
+    backend = BACKENDS[name]
+    if not backend.available():
+        return BACKENDS["pure"]
+    return backend
+
+def gil_enabled() -> bool:
+    """
+    Returns:
+        bool: False on a free-threaded CPython build (3.13t and later) running with the GIL disabled.
+    """
+    is_gil_enabled : Callable[[], bool] = getattr(sys, "_is_gil_enabled", lambda: True)
+    return is_gil_enabled()
+
+def use_threads(backend: Backend, executor: str = "auto") -> bool:
+    """
+    Decide whether a backend runs on the thread executor.
+    Args:
+        backend (Backend): The backend.
+        executor (str): "processes", "threads", or "auto" for threads when the GIL is disabled.
+    Returns:
+        bool: True for the thread executor, False for the process pool.
+    """
+    if backend.range_task is None:
+        return False
+    if backend.threads or executor == "threads":
+        return True
+    return executor == "auto" and not gil_enabled()
+
+def run_threads(file_path: str, backend: Backend, workers: int, chunks: List[Tuple[int, int]]) -> Dict[bytes, City]:
+    """
+    Run a backend on a thread pool over one mapping of the whole file. Every thread parses its chunks
+    straight out of the shared mapping, and results are merged as they complete without pickling.
+    Args:
+        file_path (str): The measurements file.
+        backend (Backend): The backend, which must have a range_task.
+        workers (int): The number of threads.
+        chunks (List[Tuple[int, int]]): The chunks of `splitter.split_file`.
+    Returns:
+        Dict[bytes, City]: The merged min, max, sum, and count for each location.
+    """
+    assert backend.range_task is not None
+    shared_results : Dict[bytes, City] = dict()
+    if not chunks:
+        return shared_results
+    with open(file_path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        with ThreadPoolExecutor(workers) as executor:
+            futures = [executor.submit(py_1brc_final.run_task, backend.range_task(mm, start, end)) for start, end in chunks]
+            for future in as_completed(futures):
+                py_1brc_final.merge_into(shared_results, future.result())
+    return shared_results
+
+def worker_pool(workers: int, pool: Optional[multiprocessing.pool.Pool] = None) -> ContextManager[multiprocessing.pool.Pool]:
+    """
+    Returns:
+        ContextManager[multiprocessing.pool.Pool]: A new pool of workers processes, terminated on exit,
+            or the given pool, e.g. the warm pool of `onebrc.api.Aggregator`, which is left running.
+    """
+    return contextlib.nullcontext(pool) if pool is not None else multiprocessing.Pool(workers)
+
+def run(
+    file_path: str,
+    backend: Backend,
+    workers: Optional[int] = None,
+    chunk_size: int = py_1brc_final.segment_size,
+    merge_mode: str = "stream",
+    executor: str = "auto",
+    start: int = 0,
+    end: int = 0,
+    pool: Optional[multiprocessing.pool.Pool] = None,
+) -> Dict[bytes, City]:
+    """
+    Aggregate the measurements file with the given backend.
+    Args:
+        file_path (str): The measurements file.
+        backend (Backend): The backend processing each chunk.
+        workers (Optional[int]): The number of worker processes or threads, defaults to the number of CPUs.
+        chunk_size (int): Split the file into chunks of about this size, 0 for one chunk per worker.
+        merge_mode (str): "stream" or "tree", see `py_1brc_final.merge_mode`. Ignored by the thread executor,
+            which merges in the calling thread.
+        executor (str): "processes" for a process pool, "threads" for threads sharing one mapping of the
+            file, or "auto" for threads when the GIL is disabled and the backend supports them.
+        start (int): Only aggregate from this position on, which must be the start of a line.
+        end (int): Only aggregate up to this position, right after a newline, 0 for the end of the file.
+        pool (Optional[multiprocessing.pool.Pool]): Run on this process pool instead of starting one.
+    Returns:
+        Dict[bytes, City]: The merged min, max, sum, and count for each location.
+    """
+    workers = workers or os.cpu_count() or 1
+    chunks = split_file(file_path, workers, chunk_size, start, end)
+    if use_threads(backend, executor):
+        return run_threads(file_path, backend, workers, chunks)
+    tasks : List[Task] = [backend.task(file_path, start, end) for start, end in chunks]
+    with worker_pool(workers, pool) as pool:
+        if merge_mode == "tree":
+            return py_1brc_final.tree_merge(pool, tasks, True)
+        shared_results : Dict[bytes, City] = dict()
+        for packed_result in pool.imap_unordered(py_1brc_final.run_task_packed, tasks):
+            merge_encoded(shared_results, packed_result)
+        return shared_results
+
+def input_files(pattern: str) -> List[str]:
+    """
+    Expand the input of a run into the measurements files it names.
+    Args:
+        pattern (str): A file, a directory whose files matching `directory_pattern` are read, or a glob
+            pattern such as `shards/measurements-*.txt`.
+    Returns:
+        List[str]: The files, sorted by name.
+    """
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, directory_pattern)
+    elif not any(character in pattern for character in "*?["):
+        return [pattern]
+    file_paths = sorted(path for path in glob.glob(pattern) if os.path.isfile(path))
+    if not file_paths:
+        raise FileNotFoundError(f"No measurements files match {pattern!r}")
+    return file_paths
+
+def plan_chunks(file_paths: List[str], workers: int, chunk_size: int) -> List[Tuple[str, int, int]]:
+    """
+    Split several files into one list of chunks, so all of them run on the same pool.
+    Args:
+        file_paths (List[str]): The measurements files.
+        workers (int): The number of workers.
+        chunk_size (int): Split the files into chunks of about this size, 0 to divide the total size of
+            the files over the workers. A file smaller than a chunk is a single chunk.
+    Returns:
+        List[Tuple[str, int, int]]: The file, start and end position of each chunk.
+    """
+    if not chunk_size:
+        chunk_size = max(-(-sum(map(os.path.getsize, file_paths)) // workers), 1)
+    return [(file_path, start, end) for file_path in file_paths for start, end in split_file(file_path, workers, chunk_size)]
+
+def run_indexed_task(indexed_task: Tuple[int, Task]) -> Tuple[int, bytes]:
+    """
+    Run a task in a worker and tag its packed result with the index of the task, so results arriving
+    out of order can be matched to their chunk.
+    """
+    index, task = indexed_task
+    return index, py_1brc_final.run_task_packed(task)
+
+def run_files(
+    file_paths: List[str],
+    backend: Backend,
+    workers: Optional[int] = None,
+    chunk_size: int = py_1brc_final.segment_size,
+    executor: str = "auto",
+    per_file: bool = False,
+    pool: Optional[multiprocessing.pool.Pool] = None,
+) -> Tuple[Dict[bytes, City], Dict[str, Dict[bytes, City]]]:
+    """
+    Aggregate several measurements files, e.g. the shards of `input_files`, as one run. The chunks of
+    all files share one pool, so many small files cost a single pool start, and finished chunks are
+    merged while the others are still being processed.
+    Args:
+        file_paths (List[str]): The measurements files.
+        backend (Backend): The backend processing each chunk.
+        workers (Optional[int]): The number of worker processes or threads, defaults to the number of CPUs.
+        chunk_size (int): The chunk size, see `plan_chunks`.
+        executor (str): The executor, see `run`.
+        per_file (bool): Also merge the results of every file on its own.
+        pool (Optional[multiprocessing.pool.Pool]): Run on this process pool instead of starting one.
+    Returns:
+        Tuple[Dict[bytes, City], Dict[str, Dict[bytes, City]]]: The merged results of all files, and
+            the merged results of each file if per_file is set, otherwise an empty dictionary.
+    """
+    workers = workers or os.cpu_count() or 1
+    chunks = plan_chunks(file_paths, workers, chunk_size)
+    shared_results : Dict[bytes, City] = dict()
+    file_results : Dict[str, Dict[bytes, City]] = {file_path: dict() for file_path in file_paths} if per_file else dict()
+    if use_threads(backend, executor):
+        assert backend.range_task is not None
+        with contextlib.ExitStack() as stack, ThreadPoolExecutor(workers) as threads:
+            mappings : Dict[str, mmap.mmap] = dict()
+            for file_path in dict.fromkeys(file_path for file_path, _, _ in chunks):
+                file = stack.enter_context(open(file_path, "rb"))
+                mappings[file_path] = stack.enter_context(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+            futures = {
+                threads.submit(py_1brc_final.run_task, backend.range_task(mappings[file_path], start, end)): file_path
+                for file_path, start, end in chunks
+            }
+            for future in as_completed(futures):
+                result = future.result()
+                if per_file:
+                    # merge_into keeps the City objects of the first result of a station, so each
+                    # merged result needs its own copy.
+                    py_1brc_final.merge_into(file_results[futures[future]], copy.deepcopy(result))
+                py_1brc_final.merge_into(shared_results, result)
+        return shared_results, file_results
+    tasks = [(index, backend.task(file_path, start, end)) for index, (file_path, start, end) in enumerate(chunks)]
+    with worker_pool(workers, pool) as pool:
+        for index, packed_result in pool.imap_unordered(run_indexed_task, tasks):
+            merge_encoded(shared_results, packed_result)
+            if per_file:
+                merge_encoded(file_results[chunks[index][0]], packed_result)
+    return shared_results, file_results
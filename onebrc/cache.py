@@ -0,0 +1,109 @@
+import contextlib
+import hashlib
+import os
+import struct
+from typing import Dict, List, Optional
+
+from stations import City
+from wire import HEADER, decode_results, encode_results
+
+# Where merged results are cached, one file per input, and the most bytes the cache may hold. The
+# least recently used entries are removed once it grows past that.
+cache_dir = os.environ.get("ONEBRC_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "onebrc"))
+max_bytes = 256 * 1024 * 1024
+
+# Number and size of the blocks spread over a file that the optional content hash reads.
+SAMPLES = 16
+SAMPLE_BYTES = 4096
+
+# Bump to ignore entries written by an older layout.
+VERSION = 1
+
+def sample_hash(file_path: str) -> bytes:
+    """
+    Hash SAMPLES blocks spread evenly over the file, for file systems whose inodes or time stamps
+    can't be trusted to change on a rewrite, e.g. some network mounts. It reads a few KiB, not the file.
+    Returns:
+        bytes: A 16 byte digest.
+    """
+    size = os.path.getsize(file_path)
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, "rb") as file:
+        for sample in range(SAMPLES):
+            digest.update(os.pread(file.fileno(), SAMPLE_BYTES, (size - SAMPLE_BYTES) * sample // (SAMPLES - 1) if size > SAMPLE_BYTES else 0))
+    return digest.digest()
+
+def cache_key(file_paths: List[str], tenths: bool, content_hash: bool = False) -> str:
+    """
+    Identify the results of a run by the identity of its input files: their path, device, inode, size,
+    modification and change time, so appending to, rewriting or replacing a file misses the cache.
+    Args:
+        file_paths (List[str]): The measurements files of the run.
+        tenths (bool): The aggregates are integer tenths of a degree rather than floats.
+        content_hash (bool): Also hash a sample of the contents of every file, see `sample_hash`.
+    Returns:
+        str: The key, the hex digest of all of the above.
+    """
+    digest = hashlib.blake2b(struct.pack("<B?", VERSION, tenths), digest_size=20)
+    for file_path in file_paths:
+        stat = os.stat(file_path)
+        digest.update(os.path.realpath(file_path).encode() + b"\0")
+        digest.update(struct.pack("<QQQqq", stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns, stat.st_ctime_ns))
+        if content_hash:
+            digest.update(sample_hash(file_path))
+    return digest.hexdigest()
+
+def load(key: str) -> Optional[Dict[bytes, City]]:
+    """
+    Look up cached results and mark them as recently used.
+    Args:
+        key (str): The key of `cache_key`.
+    Returns:
+        Optional[Dict[bytes, City]]: The merged results, or None on a miss.
+    """
+    path = os.path.join(cache_dir, key + ".bin")
+    try:
+        with open(path, "rb") as file:
+            data = file.read()
+        _, stations, names_size = HEADER.unpack_from(data)
+    except (OSError, struct.error):
+        return None
+    # Four 8 byte values per station, so a damaged entry is a miss rather than wrong results.
+    if len(data) != HEADER.size + names_size + stations * 32:
+        return None
+    os.utime(path)
+    return decode_results(data)
+
+def store(key: str, shared_results: Dict[bytes, City]) -> None:
+    """
+    Cache merged results in the format of wire.py, then evict the least recently used entries until
+    the cache fits in max_bytes. Entries are written atomically, so concurrent runs only ever see
+    complete ones.
+    Args:
+        key (str): The key of `cache_key`.
+        shared_results (Dict[bytes, City]): The merged results.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, key + ".bin")
+    with open(f"{path}.{os.getpid()}.tmp", "wb") as file:
+        file.write(encode_results(shared_results))
+    os.replace(f"{path}.{os.getpid()}.tmp", path)
+    evict()
+
+def evict() -> None:
+    """Remove the least recently used entries, by modification time, until the cache fits in max_bytes."""
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith(".bin"):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(path)
+        total -= size
@@ -0,0 +1,131 @@
+import hashlib
+import mmap
+import os
+import struct
+from typing import Dict, Optional, Tuple
+
+import py_1brc_final
+from onebrc.backends import Backend, run
+from stations import City
+from wire import HEADER as WIRE_HEADER, decode_results, encode_results
+
+# Header: magic, format version, whether the aggregates are integer tenths, the device and inode of
+# the measurements file, the number of its bytes already processed and the fingerprint of those bytes.
+# The merged results follow in the format of wire.py.
+HEADER = struct.Struct("<4sB?QQQ16s")
+MAGIC = b"1BRC"
+VERSION = 2
+
+# Bytes at the start and at the end of the processed part the fingerprint covers.
+FINGERPRINT_BYTES = 4096
+
+def fingerprint(file_path: str, offset: int) -> bytes:
+    """
+    Fingerprint the first `offset` bytes of a file by hashing its first and last FINGERPRINT_BYTES
+    bytes. A file that was only appended to keeps the fingerprint of its old length, a truncated or
+    rewritten one almost surely doesn't. Changes that keep both ends intact go unnoticed.
+    Args:
+        file_path (str): The measurements file.
+        offset (int): The length of the fingerprinted part.
+    Returns:
+        bytes: A 16 byte digest.
+    """
+    digest = hashlib.blake2b(offset.to_bytes(8, "little"), digest_size=16)
+    if offset:
+        with open(file_path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            digest.update(mm[:min(offset, FINGERPRINT_BYTES)])
+            digest.update(mm[max(0, offset - FINGERPRINT_BYTES):offset])
+    return digest.digest()
+
+def save(checkpoint_path: str, file_path: str, offset: int, shared_results: Dict[bytes, City], tenths: bool) -> None:
+    """
+    Write a checkpoint, replacing the old one atomically so a crash never leaves a partial file.
+    Args:
+        checkpoint_path (str): The checkpoint file.
+        file_path (str): The measurements file.
+        offset (int): The number of bytes processed, right after a newline.
+        shared_results (Dict[bytes, City]): The merged results of those bytes.
+        tenths (bool): The aggregates are integer tenths of a degree.
+    """
+    stat = os.stat(file_path)
+    data = HEADER.pack(MAGIC, VERSION, tenths, stat.st_dev, stat.st_ino, offset, fingerprint(file_path, offset)) + encode_results(shared_results)
+    with open(checkpoint_path + ".tmp", "wb") as file:
+        file.write(data)
+    os.replace(checkpoint_path + ".tmp", checkpoint_path)
+
+def load(checkpoint_path: str, file_path: str, tenths: bool) -> Optional[Tuple[int, Dict[bytes, City]]]:
+    """
+    Read a checkpoint if it is still valid for the measurements file.
+    Args:
+        checkpoint_path (str): The checkpoint file.
+        file_path (str): The measurements file.
+        tenths (bool): The aggregates of the backend about to run are integer tenths of a degree.
+    Returns:
+        Optional[Tuple[int, Dict[bytes, City]]]: The number of bytes processed and their merged results,
+            or None when there is no checkpoint, it is unreadable or damaged, was written with aggregates
+            of the other kind, or the file was replaced, truncated or rewritten since.
+    """
+    try:
+        with open(checkpoint_path, "rb") as file:
+            data = file.read()
+    except FileNotFoundError:
+        return None
+    if len(data) < HEADER.size:
+        return None
+    magic, version, checkpoint_tenths, device, inode, offset, checkpoint_fingerprint = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION or checkpoint_tenths != tenths:
+        return None
+    stat = os.stat(file_path)
+    if (stat.st_dev, stat.st_ino) != (device, inode) or stat.st_size < offset:
+        return None
+    if fingerprint(file_path, offset) != checkpoint_fingerprint:
+        return None
+    payload = data[HEADER.size:]
+    try:
+        _, stations, names_size = WIRE_HEADER.unpack_from(payload)
+        # Four 8 byte values per station, so a damaged checkpoint is no checkpoint rather than a crash
+        # or results missing stations.
+        if len(payload) != WIRE_HEADER.size + names_size + stations * 32:
+            return None
+        shared_results = decode_results(payload)
+    except (struct.error, ValueError):
+        return None
+    if len(shared_results) != stations:
+        return None
+    return offset, shared_results
+
+def complete_lines_end(file_path: str) -> int:
+    """
+    Returns:
+        int: The position right after the last newline of the file. A line still being appended is
+            left for the next run.
+    """
+    if os.path.getsize(file_path) == 0:
+        return 0
+    with open(file_path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return mm.rfind(b"\n") + 1
+
+def run_incremental(checkpoint_path: str, file_path: str, backend: Backend, workers: Optional[int] = None, chunk_size: int = py_1brc_final.segment_size, executor: str = "auto") -> Dict[bytes, City]:
+    """
+    Aggregate a file that only grows by appending: load the checkpoint, process only the complete lines
+    past its offset, merge them into the loaded results and save the new checkpoint. Without a valid
+    checkpoint the whole file is processed.
+    Args:
+        checkpoint_path (str): The checkpoint file, created if missing.
+        file_path (str): The measurements file.
+        backend (Backend): The backend processing each chunk.
+        workers (Optional[int]): The number of worker processes or threads.
+        chunk_size (int): Split the new bytes into chunks of about this size, 0 for one chunk per worker.
+        executor (str): The executor, see `onebrc.run`.
+    Returns:
+        Dict[bytes, City]: The merged min, max, sum, and count for each location.
+    """
+    checkpoint = load(checkpoint_path, file_path, backend.tenths)
+    offset, shared_results = checkpoint if checkpoint is not None else (0, dict())
+    end = complete_lines_end(file_path)
+    if end > offset:
+        py_1brc_final.merge_into(shared_results, run(file_path, backend, workers, chunk_size, executor=executor, start=offset, end=end))
+        save(checkpoint_path, file_path, end, shared_results, backend.tenths)
+    elif checkpoint is None:
+        save(checkpoint_path, file_path, end, shared_results, backend.tenths)
+    return shared_results
@@ -0,0 +1,307 @@
+import argparse
+import collections
+import contextlib
+import gzip
+import mmap
+import multiprocessing.pool
+import os
+import struct
+import sys
+import zlib
+from typing import BinaryIO, Deque, Dict, Iterator, List, Optional, Tuple, Union
+
+import py_1brc_final
+from onebrc.backends import BACKENDS, Backend, worker_pool
+from stations import City
+from wire import merge_encoded
+
+# Decompressed bytes read at once by the streaming pipeline. Each read is cut at its last newline and
+# handed to a parser worker as one block.
+buffer_size = 32 * 1024 * 1024
+
+# Compressed bytes per task when independent members or frames are decompressed in parallel.
+task_size = 8 * 1024 * 1024
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+# The seek table of the zstd seekable format ends in a footer of the number of frames, a descriptor
+# byte whose top bit flags per frame checksums, and this magic. It is held in a skippable frame.
+SEEKABLE_FOOTER = struct.Struct("<IBI")
+SEEKABLE_MAGIC = 0x8F92EAB1
+SKIPPABLE_HEADER = struct.Struct("<II")
+SKIPPABLE_MAGIC = 0x184D2A5E
+
+# Uncompressed bytes per BGZF member, as written by bgzip, so a compressed member fits its 16 bit size.
+BGZF_BLOCK = 0xFF00
+
+# Uncompressed bytes per frame of the zstd seekable files written by `compress`.
+frame_size = 1024 * 1024
+
+def compression(file_path: str) -> Optional[str]:
+    """
+    Returns:
+        Optional[str]: "gzip" or "zstd" by the magic bytes of the file, None for a plain file.
+    """
+    with open(file_path, "rb") as file:
+        magic = file.read(4)
+    if magic.startswith(GZIP_MAGIC):
+        return "gzip"
+    if magic == ZSTD_MAGIC:
+        return "zstd"
+    return None
+
+def gzip_members(mm: mmap.mmap) -> Optional[List[Tuple[int, int]]]:
+    """
+    Find the members of a BGZF file (blocked gzip as written by bgzip), whose headers carry the size of
+    their member in a "BC" extra field, so the members are found without decompressing them.
+    Args:
+        mm (mmap.mmap): The memory-mapped file.
+    Returns:
+        Optional[List[Tuple[int, int]]]: The offset and size of each member, or None when a member
+            doesn't record its size, e.g. a file compressed by gzip, which is decompressed as a stream.
+    """
+    members = []
+    position = 0
+    while position < len(mm):
+        # ID1 ID2 CM FLG MTIME XFL OS XLEN, then the extra subfields.
+        if mm[position:position + 2] != GZIP_MAGIC or not mm[position + 3] & 4:
+            return None
+        extra_end = position + 12 + int.from_bytes(mm[position + 10:position + 12], "little")
+        field = position + 12
+        size = 0
+        while field + 4 <= extra_end:
+            length = int.from_bytes(mm[field + 2:field + 4], "little")
+            if mm[field:field + 2] == b"BC" and length == 2:
+                size = int.from_bytes(mm[field + 4:field + 6], "little") + 1
+            field += 4 + length
+        if not size:
+            return None
+        members.append((position, size))
+        position += size
+    return members
+
+def zstd_frames(mm: mmap.mmap) -> Optional[List[Tuple[int, int]]]:
+    """
+    Find the frames of a file in the zstd seekable format from its seek table.
+    Args:
+        mm (mmap.mmap): The memory-mapped file.
+    Returns:
+        Optional[List[Tuple[int, int]]]: The offset and size of each frame, or None when the file has
+            no seek table and is decompressed as a stream.
+    """
+    if len(mm) < SEEKABLE_FOOTER.size:
+        return None
+    count, descriptor, magic = SEEKABLE_FOOTER.unpack_from(mm, len(mm) - SEEKABLE_FOOTER.size)
+    entry_size = 12 if descriptor & 0x80 else 8
+    table_start = len(mm) - SEEKABLE_FOOTER.size - count * entry_size
+    if magic != SEEKABLE_MAGIC or table_start < SKIPPABLE_HEADER.size:
+        return None
+    frames = []
+    position = 0
+    for entry in range(count):
+        size = int.from_bytes(mm[table_start + entry * entry_size:table_start + entry * entry_size + 4], "little")
+        frames.append((position, size))
+        position += size
+    if position != table_start - SKIPPABLE_HEADER.size:
+        return None
+    return frames
+
+def group(parts: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """
+    Returns:
+        List[Tuple[int, int]]: The offset and size of runs of consecutive members or frames of about
+            task_size compressed bytes each.
+    """
+    tasks : List[Tuple[int, int]] = []
+    for offset, size in parts:
+        if tasks and tasks[-1][1] < task_size:
+            tasks[-1] = (tasks[-1][0], tasks[-1][1] + size)
+        else:
+            tasks.append((offset, size))
+    return tasks
+
+@contextlib.contextmanager
+def open_decompressed(file_path: str, kind: str) -> Iterator[Union[gzip.GzipFile, BinaryIO]]:
+    """
+    Open a compressed file as a stream of its decompressed bytes, reading across all members or frames.
+    Args:
+        file_path (str): The compressed file.
+        kind (str): "gzip" or "zstd". zstd needs the optional zstandard package.
+    Returns:
+        Iterator[Union[gzip.GzipFile, BinaryIO]]: The decompressed stream, as a context manager.
+    """
+    if kind == "gzip":
+        with gzip.open(file_path, "rb") as stream:
+            yield stream
+        return
+    import zstandard  # type: ignore[import-not-found]
+    with open(file_path, "rb") as file, zstandard.ZstdDecompressor().stream_reader(file, read_across_frames=True) as reader:
+        yield reader
+
+def decompress(data: bytes, kind: str) -> bytes:
+    """
+    Returns:
+        bytes: The decompressed bytes of consecutive gzip members or zstd frames.
+    """
+    if kind == "gzip":
+        return gzip.decompress(data)
+    import zstandard  # type: ignore[import-not-found]
+    with zstandard.ZstdDecompressor().stream_reader(data, read_across_frames=True) as reader:
+        return reader.read()
+
+def stream_blocks(file_path: str, kind: str) -> Iterator[bytes]:
+    """
+    Decompress a file as a stream into blocks of complete lines of about buffer_size bytes.
+    Args:
+        file_path (str): The compressed file.
+        kind (str): "gzip" or "zstd".
+    Returns:
+        Iterator[bytes]: The blocks. The last one may lack the trailing newline.
+    """
+    rest = b""
+    with open_decompressed(file_path, kind) as stream:
+        while data := stream.read(buffer_size):
+            data = rest + data
+            cut = data.rfind(b"\n") + 1
+            if cut:
+                yield data[:cut]
+            rest = data[cut:]
+    if rest:
+        yield rest
+
+def process_part(args: Tuple[str, str, int, int, str]) -> Tuple[bytes, Optional[bytes], bytes]:
+    """
+    Decompress and parse a run of members or frames in a worker. Its first and last line may continue
+    in the neighbouring runs, so only the lines in between are parsed and the two ends are returned for
+    the caller to join with the ends of the neighbours.
+    Args:
+        args (Tuple[str, str, int, int, str]): The file, its compression, the offset and size of the run,
+            and the name of the backend.
+    Returns:
+        Tuple[bytes, Optional[bytes], bytes]: The bytes up to and including the first newline, the
+            bytes after the last newline, or None if the run has no newline and the first element holds
+            all of it, and the packed result of the lines in between.
+    """
+    file_path, kind, offset, size, backend_name = args
+    with open(file_path, "rb") as file:
+        data = decompress(os.pread(file.fileno(), size, offset), kind)
+    first = data.find(b"\n") + 1
+    if not first:
+        return data, None, b""
+    last = data.rfind(b"\n") + 1
+    range_task = BACKENDS[backend_name].range_task
+    assert range_task is not None
+    return data[:first], data[last:], py_1brc_final.run_task_packed(range_task(data, first, last)) if last > first else b""
+
+def compress(file_path: str, output_path: str, kind: str, level: int = 6) -> None:
+    """
+    Compress a measurements file into a BGZF file or a zstd file in the seekable format, which
+    `run_compressed` decompresses in parallel. Both remain readable by gzip and zstd.
+    Args:
+        file_path (str): The measurements file.
+        output_path (str): The compressed file to write.
+        kind (str): "gzip" or "zstd". zstd needs the optional zstandard package.
+        level (int): The compression level.
+    """
+    block = BGZF_BLOCK if kind == "gzip" else frame_size
+    sizes : List[Tuple[int, int]] = []
+    with open(file_path, "rb") as file, open(output_path, "wb") as output:
+        while data := file.read(block):
+            if kind == "gzip":
+                compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+                deflated = compressor.compress(data) + compressor.flush()
+                # ID1 ID2 CM FLG=FEXTRA MTIME XFL OS XLEN, the BC subfield with the member size - 1.
+                header = GZIP_MAGIC + struct.pack("<BBIBBHBBHH", 8, 4, 0, 0, 255, 6, ord("B"), ord("C"), 2, 18 + len(deflated) + 8 - 1)
+                output.write(header + deflated + struct.pack("<II", zlib.crc32(data), len(data)))
+            else:
+                import zstandard  # type: ignore[import-not-found]
+                frame = zstandard.ZstdCompressor(level=level).compress(data)
+                sizes.append((len(frame), len(data)))
+                output.write(frame)
+        if kind == "zstd":
+            table = b"".join(struct.pack("<II", *size) for size in sizes) + SEEKABLE_FOOTER.pack(len(sizes), 0, SEEKABLE_MAGIC)
+            output.write(SKIPPABLE_HEADER.pack(SKIPPABLE_MAGIC, len(table)) + table)
+
+def run_parallel(file_path: str, kind: str, parts: List[Tuple[int, int]], backend: Backend, pool: multiprocessing.pool.Pool) -> Dict[bytes, City]:
+    """
+    Decompress and parse runs of independent members or frames on the pool, see `process_part`. The
+    lines split between runs are joined in order and parsed at the end.
+    Returns:
+        Dict[bytes, City]: The merged min, max, sum, and count for each location.
+    """
+    assert backend.range_task is not None
+    shared_results : Dict[bytes, City] = dict()
+    joined : List[bytes] = []
+    pending = b""
+    tasks = [(file_path, kind, offset, size, backend.name) for offset, size in group(parts)]
+    for head, tail, packed_result in pool.imap(process_part, tasks):
+        if tail is None:
+            pending += head
+            continue
+        joined.append(pending + head)
+        pending = tail
+        if packed_result:
+            merge_encoded(shared_results, packed_result)
+    joined.append(pending)
+    lines = b"".join(joined)
+    if lines:
+        py_1brc_final.merge_into(shared_results, py_1brc_final.run_task(backend.range_task(lines, 0, len(lines))))
+    return shared_results
+
+def run_stream(file_path: str, kind: str, backend: Backend, pool: multiprocessing.pool.Pool, workers: int) -> Dict[bytes, City]:
+    """
+    Decompress the file in this process and parse its blocks on the pool, with at most two blocks per
+    worker in flight so memory stays bounded while decompression overlaps with parsing.
+    Returns:
+        Dict[bytes, City]: The merged min, max, sum, and count for each location.
+    """
+    assert backend.range_task is not None
+    shared_results : Dict[bytes, City] = dict()
+    in_flight : Deque[multiprocessing.pool.AsyncResult[bytes]] = collections.deque()
+    for block in stream_blocks(file_path, kind):
+        in_flight.append(pool.apply_async(py_1brc_final.run_task_packed, (backend.range_task(block, 0, len(block)),)))
+        if len(in_flight) >= 2 * workers:
+            merge_encoded(shared_results, in_flight.popleft().get())
+    while in_flight:
+        merge_encoded(shared_results, in_flight.popleft().get())
+    return shared_results
+
+def run_compressed(file_path: str, backend: Backend, workers: Optional[int] = None, pool: Optional[multiprocessing.pool.Pool] = None) -> Dict[bytes, City]:
+    """
+    Aggregate a gzip or zstd compressed measurements file without expanding it to disk. BGZF files and
+    zstd files in the seekable format are decompressed in parallel, any other file is decompressed as
+    one stream while a pool parses the decompressed blocks.
+    Args:
+        file_path (str): The compressed file, see `compression`.
+        backend (Backend): The backend parsing the blocks, which must have a range_task.
+        workers (Optional[int]): The number of worker processes, defaults to the number of CPUs.
+        pool (Optional[multiprocessing.pool.Pool]): Run on this process pool instead of starting one.
+    Returns:
+        Dict[bytes, City]: The merged min, max, sum, and count for each location.
+    """
+    if backend.range_task is None:
+        raise ValueError(f"Backend {backend.name!r} can't parse decompressed blocks")
+    kind = compression(file_path)
+    if kind is None:
+        raise ValueError(f"{file_path} is not gzip or zstd compressed")
+    workers = workers or os.cpu_count() or 1
+    with open(file_path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        parts = gzip_members(mm) if kind == "gzip" else zstd_frames(mm)
+    with worker_pool(workers, pool) as pool:
+        if parts is not None:
+            return run_parallel(file_path, kind, parts, backend, pool)
+        return run_stream(file_path, kind, backend, pool, workers)
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Compress a measurements file into a layout that is decompressed in parallel."""
+    parser = argparse.ArgumentParser(prog="python -m onebrc.compressed", description="Compress a measurements file into BGZF or seekable zstd")
+    parser.add_argument("file_path", help="The measurements file")
+    parser.add_argument("output", help="The compressed file to write")
+    parser.add_argument("-k", "--kind", choices=["gzip", "zstd"], default="gzip")
+    parser.add_argument("-l", "--level", type=int, default=6)
+    args = parser.parse_args(argv)
+    compress(args.file_path, args.output, args.kind, args.level)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,116 @@
+import mmap
+import os
+import time
+from typing import BinaryIO, Dict, Generator, Optional
+
+import py_1brc_final
+from onebrc import checkpoint
+from stations import City
+
+# Seconds to wait before looking for appended lines again when the file hasn't grown.
+poll_interval = 0.5
+
+def next_end(mm: mmap.mmap, position: int, size: int, block_size: int) -> int:
+    """
+    Find the end of the next block of complete lines, like `py_1brc_final.iter_blocks`.
+    Args:
+        mm (mmap.mmap): The memory-mapped file object.
+        position (int): The start of the block, at the start of a line.
+        size (int): The size of the file.
+        block_size (int): The target size of the block.
+    Returns:
+        int: The position right after the last newline of the block, or `position` when no complete
+            line follows it yet.
+    """
+    limit = min(position + block_size, size)
+    end = mm.rfind(b"\n", position, limit) + 1
+    if end <= position:
+        end = mm.find(b"\n", limit, size) + 1
+    return max(end, position)
+
+def replaced(file: BinaryIO, file_path: str) -> bool:
+    """
+    Returns:
+        bool: Whether file_path now names another file than the open file, e.g. after a rename based
+            rotation created a new file in its place. False while nothing exists at file_path yet.
+    """
+    try:
+        current = os.stat(file_path)
+    except FileNotFoundError:
+        return False
+    opened = os.fstat(file.fileno())
+    return (current.st_dev, current.st_ino) != (opened.st_dev, opened.st_ino)
+
+def follow(
+    file_path: str,
+    interval: float = 10,
+    rows: int = 0,
+    fixed_point: bool = False,
+    checkpoint_path: Optional[str] = None,
+    block_size: int = py_1brc_final.block_size or 8 * 1024 * 1024,
+) -> Generator[Dict[bytes, City], None, None]:
+    """
+    Aggregate a file while it is being appended to. The file stays open and is only mapped again when
+    its size changes. Appended complete lines are parsed once, a block at a time, by
+    `py_1brc_final.process_range` and merged into the running results, so memory stays bounded by the
+    number of stations and the block size. A line still being written waits for its newline. When the
+    file shrinks, it was truncated, and aggregation starts over from its start. When the path names a
+    new file once the open one is read to its end, it was rotated or replaced, and the new file is
+    opened and aggregated from its start.
+    Args:
+        file_path (str): The measurements file.
+        interval (float): Yield a snapshot when this many seconds passed since the last one and rows
+            were added, 0 to only yield by row count.
+        rows (int): Yield a snapshot once this many rows were added since the last one, checked after
+            every block, 0 to only yield by interval.
+        fixed_point (bool): Aggregate integer tenths instead of floats.
+        checkpoint_path (Optional[str]): Resume from this checkpoint (see `onebrc.checkpoint`) and save
+            it at every snapshot.
+        block_size (int): The most bytes parsed at once.
+    Returns:
+        Generator[Dict[bytes, City], None, None]: The merged results at every snapshot, for all rows so
+            far. The same dictionary is updated in place after the next snapshot is requested.
+    """
+    loaded = checkpoint.load(checkpoint_path, file_path, fixed_point) if checkpoint_path else None
+    offset, shared_results = loaded if loaded is not None else (0, dict())
+    pending = 0  # Rows added since the last snapshot.
+    last_snapshot = time.monotonic()
+    mm : Optional[mmap.mmap] = None
+    file = open(file_path, "rb")
+    try:
+        while True:
+            size = os.fstat(file.fileno()).st_size
+            if size < offset:
+                offset, shared_results, pending = 0, dict(), 0
+            if mm is not None and len(mm) != size:
+                mm.close()
+                mm = None
+            if mm is None and size:
+                mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            end = next_end(mm, offset, size, block_size) if mm is not None else offset
+            idle = end == offset
+            if not idle:
+                assert mm is not None
+                result = py_1brc_final.process_range(mm, offset, end, fixed_point, block_size)
+                pending += sum(city.count for city in result.values())
+                py_1brc_final.merge_into(shared_results, result)
+                offset = end
+            if pending and ((rows and pending >= rows) or (interval and time.monotonic() - last_snapshot >= interval)):
+                if checkpoint_path:
+                    checkpoint.save(checkpoint_path, file_path, offset, shared_results, fixed_point)
+                yield shared_results
+                pending, last_snapshot = 0, time.monotonic()
+            elif idle:
+                if replaced(file, file_path):
+                    if mm is not None:
+                        mm.close()
+                        mm = None
+                    file.close()
+                    file = open(file_path, "rb")
+                    offset, shared_results, pending = 0, dict(), 0
+                    continue
+                time.sleep(poll_interval)
+    finally:
+        if mm is not None:
+            mm.close()
+        file.close()
@@ -0,0 +1,232 @@
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from archive.create_better_measurements import CreateMeasurement
+
+# Rows drawn per batch. Batch b is drawn from its own generator seeded with (seed, b), so the file
+# only depends on the seed, not on how many processes wrote it.
+BATCH_ROWS = 1 << 18
+
+# Every temperature in the one decimal range of the challenge, -99.9 to 99.9, followed by the newline.
+TEMPERATURES = [f"{tenths / 10:.1f}\n".encode() for tenths in range(-999, 1000)]
+
+# Longest station name the challenge allows, in UTF-8 bytes.
+MAX_NAME_BYTES = 100
+
+# Multi-byte characters long station names are padded with, from two to four UTF-8 bytes each.
+PADDING = "éøłßçñüžąőæ日本東京北京서울ÅÖ𝔸"
+
+def synthetic_stations(count: int, seed: int = 0, name_bytes: int = 0, shared_prefix: int = 0) -> List[Tuple[str, float]]:
+    """
+    Build a station list that stresses the hash tables and merges of the engines.
+    Args:
+        count (int): The number of stations. Beyond the stations of `CreateMeasurement`, names get a
+            number appended and a mean drawn from -20 to 35 degrees.
+        seed (int): The seed of the padding and the means.
+        name_bytes (int): Pad names with multi-byte UTF-8 characters to a random length of up to this
+            many bytes (at most MAX_NAME_BYTES), 0 to keep them short.
+        shared_prefix (int): Start every name with the same run of this many bytes, so names only
+            differ after it and hashes or comparisons over their first bytes collide.
+    Returns:
+        List[Tuple[str, float]]: The name and mean temperature of every station.
+    """
+    rng = np.random.default_rng([seed, count])
+    base = CreateMeasurement.STATIONS
+    # Leave room for the number that keeps the names unique.
+    shared_prefix = min(shared_prefix, MAX_NAME_BYTES - 16)
+    prefix = ("Station " * (shared_prefix // 8 + 1))[:shared_prefix]
+    stations = []
+    for index in range(count):
+        name, mean = base[index % len(base)]
+        if index >= len(base):
+            mean = round(float(rng.uniform(-20, 35)), 1)
+        # Truncating names to fit a prefix or the padding could make them equal, so number them.
+        suffix = f" {index}" if count > len(base) or shared_prefix else ""
+        limit = int(rng.integers(1, min(name_bytes, MAX_NAME_BYTES) + 1)) if name_bytes else MAX_NAME_BYTES
+        if name_bytes:
+            for character in rng.choice(list(PADDING), MAX_NAME_BYTES):
+                if len((prefix + name + character + suffix).encode()) > limit:
+                    break
+                name += character
+        # Cut the name between the prefix and the number, on a character boundary.
+        while len((prefix + name + suffix).encode()) > MAX_NAME_BYTES and len(name) > 1:
+            name = name[:-1]
+        name = prefix + name + suffix
+        stations.append((name, mean))
+    return stations
+
+class Tables:
+    """
+    The byte tables rows are gathered from: "name;" and "temperature\\n" for every station and every
+    temperature, zero padded to a common width. Zero bytes can't occur in either, so a batch is
+    formatted by gathering a row of each table per line and dropping the zeros.
+    """
+    def __init__(self, stations: Sequence[Tuple[str, float]], std_dev: float, zipf: float = 0) -> None:
+        """
+        Args:
+            stations (Sequence[Tuple[str, float]]): The name and mean temperature of every station.
+            std_dev (float): The standard deviation of the temperatures around their mean.
+            zipf (float): Draw the n-th station with a probability proportional to 1 / n ** zipf, 0 to
+                draw them uniformly.
+        """
+        prefixes = [name.encode() + b";" for name, _ in stations]
+        self.prefixes = padded(prefixes)
+        self.prefix_lengths = np.array([len(prefix) for prefix in prefixes], dtype=np.int64)
+        self.temperatures = padded(TEMPERATURES)
+        self.temperature_lengths = np.array([len(temperature) for temperature in TEMPERATURES], dtype=np.int64)
+        self.means = np.array([mean for _, mean in stations], dtype=np.float64)
+        self.std_dev = std_dev
+        self.cumulative : Optional[np.ndarray] = None
+        if zipf:
+            weights = 1 / np.arange(1, len(stations) + 1, dtype=np.float64) ** zipf
+            self.cumulative = np.cumsum(weights / weights.sum())
+
+def padded(rows: List[bytes]) -> np.ndarray:
+    """
+    Returns:
+        np.ndarray: A uint8 matrix with one zero padded row per bytes object.
+    """
+    matrix = np.zeros((len(rows), max(map(len, rows))), dtype=np.uint8)
+    for index, row in enumerate(rows):
+        matrix[index, :len(row)] = np.frombuffer(row, dtype=np.uint8)
+    return matrix
+
+# The tables of the pool workers, set by `init_worker`.
+_tables : Optional[Tables] = None
+
+def init_worker(tables: Tables) -> None:
+    """Store the tables in each worker, so they are not sent along with every batch."""
+    global _tables
+    _tables = tables
+
+def draw(tables: Tables, seed: int, batch: int, rows: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Draw the stations and temperatures of a batch.
+    Args:
+        tables (Tables): The station and temperature tables.
+        seed (int): The seed of the file.
+        batch (int): The number of the batch.
+        rows (int): The number of rows of the batch.
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The station index and the temperature index (tenths + 999) of each row.
+    """
+    rng = np.random.default_rng([seed, batch])
+    if tables.cumulative is None:
+        stations = rng.integers(0, len(tables.means), rows)
+    else:
+        stations = np.minimum(np.searchsorted(tables.cumulative, rng.random(rows), side="right"), len(tables.means) - 1)
+    tenths = np.rint(rng.normal(tables.means[stations], tables.std_dev) * 10)
+    return stations, np.clip(tenths, -999, 999).astype(np.int64) + 999
+
+def format_batch(tables: Tables, seed: int, batch: int, rows: int) -> bytes:
+    """
+    Returns:
+        bytes: The `name;temp\\n` lines of a batch, see `draw`.
+    """
+    stations, temperatures = draw(tables, seed, batch, rows)
+    lines = np.hstack((tables.prefixes[stations], tables.temperatures[temperatures]))
+    return lines[lines != 0].tobytes()
+
+def batch_rows(records: int, batch: int) -> int:
+    """
+    Returns:
+        int: The number of rows of a batch, BATCH_ROWS except for the last one.
+    """
+    return min(BATCH_ROWS, records - batch * BATCH_ROWS)
+
+def batch_size(args: Tuple[int, int, int]) -> int:
+    """
+    Compute the size of a batch in bytes without formatting it.
+    Args:
+        args (Tuple[int, int, int]): The seed, the batch and its number of rows.
+    Returns:
+        int: The size of the formatted batch.
+    """
+    assert _tables is not None
+    stations, temperatures = draw(_tables, *args)
+    return int(_tables.prefix_lengths[stations].sum() + _tables.temperature_lengths[temperatures].sum())
+
+def write_batch(args: Tuple[str, int, int, int, int]) -> None:
+    """
+    Format a batch and write it into its place in the output file.
+    Args:
+        args (Tuple[str, int, int, int, int]): The file name, its offset, the seed, the batch and its number of rows.
+    """
+    assert _tables is not None
+    file_name, offset, seed, batch, rows = args
+    data = format_batch(_tables, seed, batch, rows)
+    fd = os.open(file_name, os.O_WRONLY)
+    try:
+        os.pwrite(fd, data, offset)
+    finally:
+        os.close(fd)
+
+def generate(
+    file_name: str,
+    records: int,
+    seed: int = 0,
+    processes: int = 1,
+    std_dev: float = 10,
+    stations: Sequence[Tuple[str, float]] = CreateMeasurement.STATIONS,
+    zipf: float = 0,
+) -> None:
+    """
+    Write a measurements file of `records` lines `name;temp\\n`, with a uniformly drawn station and a
+    normally distributed temperature with one decimal, like `CreateMeasurement.generateMeasurementFile`.
+    Args:
+        file_name (str): The file to write.
+        records (int): The number of rows.
+        seed (int): The seed, the same seed always gives the same file.
+        processes (int): Format the batches in this many processes. Each batch is written at an offset
+            computed up front from a sizing pass over all batches.
+        std_dev (float): The standard deviation of the temperatures around the mean of their station.
+        stations (Sequence[Tuple[str, float]]): The name and mean temperature of every station, see
+            `synthetic_stations` for larger and adversarial sets.
+        zipf (float): Skew the station frequencies, see `Tables`.
+    """
+    tables = Tables(stations, std_dev, zipf)
+    batches = range((records + BATCH_ROWS - 1) // BATCH_ROWS)
+    if processes <= 1:
+        with open(file_name, "wb") as file:
+            for batch in batches:
+                file.write(format_batch(tables, seed, batch, batch_rows(records, batch)))
+        return
+    with multiprocessing.Pool(processes, initializer=init_worker, initargs=(tables,)) as pool:
+        sizes = pool.map(batch_size, [(seed, batch, batch_rows(records, batch)) for batch in batches], chunksize=16)
+        offsets = np.concatenate(([0], np.cumsum(sizes, dtype=np.int64)))
+        with open(file_name, "wb") as file:
+            file.truncate(int(offsets[-1]))
+        tasks : Iterable[Tuple[str, int, int, int, int]] = (
+            (file_name, int(offsets[batch]), seed, batch, batch_rows(records, batch)) for batch in batches
+        )
+        for _ in pool.imap_unordered(write_batch, tasks, chunksize=4):
+            pass
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Generate a measurements file from the command line."""
+    parser = argparse.ArgumentParser(prog="python -m onebrc.generate", description="Create measurement file")
+    parser.add_argument("-o", "--output", default="measurements.txt", help="Measurement file name")
+    parser.add_argument("-r", "--records", type=int, default=1_000_000_000, help="Number of records to create")
+    parser.add_argument("-s", "--seed", type=int, default=0)
+    parser.add_argument("-p", "--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--stations", type=int, default=0, help="Number of stations, e.g. 10000 (default: the stations of CreateMeasurement)")
+    parser.add_argument("--name-bytes", type=int, default=0, help=f"Pad names with multi-byte UTF-8 to up to this many bytes (max {MAX_NAME_BYTES})")
+    parser.add_argument("--shared-prefix", type=int, default=0, help="Give all names a common prefix of this many bytes")
+    parser.add_argument("--zipf", type=float, default=0, help="Zipf exponent of the station frequencies, 0 for uniform")
+    args = parser.parse_args(argv)
+
+    stations : Sequence[Tuple[str, float]] = CreateMeasurement.STATIONS
+    if args.stations or args.name_bytes or args.shared_prefix:
+        stations = synthetic_stations(args.stations or len(CreateMeasurement.STATIONS), args.seed, args.name_bytes, args.shared_prefix)
+    start = time.perf_counter()
+    generate(args.output, args.records, args.seed, args.processes, stations=stations, zipf=args.zipf)
+    print(f"Created file '{args.output}' with {args.records:,} measurements in {time.perf_counter() - start:.2f} seconds")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
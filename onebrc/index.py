@@ -0,0 +1,225 @@
+import argparse
+import mmap
+import multiprocessing
+import os
+import struct
+import sys
+import time
+from types import TracebackType
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Type
+
+import numpy as np
+
+import numpy_chunk
+import py_1brc_final
+from splitter import mmap_window, split_file
+from stations import City
+
+# Trailer at the end of the sidecar: magic, format version, size and modification time of the text
+# file it was built from, and the offset of the footer, the number of stations, of row groups and the
+# size of the station names. The footer holds the offset of every row group followed by the station
+# names joined by newlines, their position being their station ID. A row group is its number of rows
+# followed by a uint16 station ID column and an int16 temperature column in tenths, native byte order.
+TRAILER = struct.Struct("<4sBQqQIIQ")
+MAGIC = b"1BRI"
+VERSION = 1
+GROUP_HEADER = struct.Struct("<Q")
+
+# The station ID column is uint16.
+MAX_STATIONS = 1 << 16
+
+def index_path(file_path: str) -> str:
+    """
+    Returns:
+        str: The default path of the sidecar of a measurements file.
+    """
+    return file_path + ".idx"
+
+def parse_chunk(chunk: Tuple[str, int, int]) -> Tuple[List[bytes], np.ndarray, np.ndarray]:
+    """
+    Parse a chunk of the text file into columns in a worker, with the block parser of numpy_chunk.py.
+    Args:
+        chunk (Tuple[str, int, int]): The file and the start and end position of the chunk.
+    Returns:
+        Tuple[List[bytes], np.ndarray, np.ndarray]: The station names of the chunk, and the uint16
+            station ID, into those names, and the int16 temperature in tenths of every row.
+    Raises:
+        ValueError: The chunk has more than MAX_STATIONS stations.
+    """
+    file_path, chunk_start, chunk_end = chunk
+    offset, length, position = mmap_window(chunk_start, chunk_end)
+    names : Dict[bytes, int] = dict()
+    ids : List[np.ndarray] = []
+    temps : List[np.ndarray] = []
+    with open(file_path, "rb") as file:
+        mm = mmap.mmap(file.fileno(), length=length, access=mmap.ACCESS_READ, offset=offset)
+        for block in numpy_chunk.iter_blocks(mm, position, numpy_chunk.block_size, length):
+            starts, semicolons, block_temps, block_ids, first = numpy_chunk.parse_block(block)
+            # Block IDs are local to the block, map them to the IDs of the chunk.
+            chunk_ids = [names.setdefault(block[starts[row]:semicolons[row]].tobytes(), len(names)) for row in first.tolist()]
+            if len(names) > MAX_STATIONS:
+                raise ValueError(f"{file_path} has more than {MAX_STATIONS} stations, which the uint16 station column can't hold")
+            # uint16 IDs are what the sidecar stores, and a quarter of the bytes of int64 IDs to send back.
+            ids.append(np.array(chunk_ids, dtype=np.uint16)[block_ids])
+            temps.append(block_temps)
+            del block
+        mm.close()
+    if not ids:
+        return [], np.empty(0, dtype=np.uint16), np.empty(0, dtype=np.int16)
+    return list(names), np.concatenate(ids), np.concatenate(temps)
+
+def build(file_path: str, output_path: Optional[str] = None, workers: Optional[int] = None, chunk_size: int = py_1brc_final.segment_size) -> int:
+    """
+    Convert a measurements file into a columnar sidecar, parsing chunks on a process pool and writing
+    one row group per chunk in file order. The sidecar is written to a temporary file and renamed.
+    Args:
+        file_path (str): The measurements file.
+        output_path (Optional[str]): The sidecar, `index_path(file_path)` by default.
+        workers (Optional[int]): The number of worker processes, defaults to the number of CPUs.
+        chunk_size (int): The size of the chunks, and so of the row groups, in bytes of text.
+    Returns:
+        int: The number of rows.
+    """
+    output_path = output_path or index_path(file_path)
+    workers = workers or os.cpu_count() or 1
+    stat = os.stat(file_path)
+    stations : Dict[bytes, int] = dict()
+    offsets : List[int] = []
+    rows = 0
+    chunks = [(file_path, start, end) for start, end in split_file(file_path, workers, chunk_size)]
+    with multiprocessing.Pool(workers) as pool:
+        output = open(output_path + ".tmp", "wb")
+        try:
+            with output:
+                for names, ids, temps in pool.imap(parse_chunk, chunks):
+                    mapping = np.array([stations.setdefault(name, len(stations)) for name in names], dtype=np.int64)
+                    if len(stations) > MAX_STATIONS:
+                        raise ValueError(f"{file_path} has more than {MAX_STATIONS} stations, which the uint16 station column can't hold")
+                    offsets.append(output.tell())
+                    output.write(GROUP_HEADER.pack(len(ids)))
+                    output.write(mapping[ids].astype(np.uint16).tobytes() if len(ids) else b"")
+                    output.write(temps.astype(np.int16).tobytes())
+                    rows += len(ids)
+                footer_offset = output.tell()
+                names_table = b"\n".join(stations)
+                output.write(np.array(offsets, dtype=np.int64).tobytes() + names_table)
+                output.write(TRAILER.pack(MAGIC, VERSION, stat.st_size, stat.st_mtime_ns, footer_offset, len(stations), len(offsets), len(names_table)))
+        except BaseException:
+            # Don't leave a partial sidecar behind when the input is rejected or the build interrupted.
+            os.remove(output_path + ".tmp")
+            raise
+    os.replace(output_path + ".tmp", output_path)
+    return rows
+
+class ColumnarIndex:
+    """
+    A sidecar written by `build`, memory-mapped so the columns are read as NumPy views without copies
+    or text parsing.
+    """
+    def __init__(self, path: str, file_path: Optional[str] = None) -> None:
+        """
+        Args:
+            path (str): The sidecar.
+            file_path (Optional[str]): The measurements file it must still match, by size and
+                modification time, None to skip the check.
+        Raises:
+            ValueError: The sidecar is not one, or is stale.
+        """
+        self.file = open(path, "rb")
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.mm) < TRAILER.size:
+            self.close()
+            raise ValueError(f"{path} is not a measurements index")
+        magic, version, size, mtime_ns, footer_offset, stations, groups, names_size = TRAILER.unpack_from(self.mm, len(self.mm) - TRAILER.size)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a measurements index of version {VERSION}")
+        if file_path is not None:
+            stat = os.stat(file_path)
+            if (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns):
+                self.close()
+                raise ValueError(f"{path} is stale, {file_path} changed since it was built")
+        self.offsets = np.frombuffer(self.mm, dtype=np.int64, count=groups, offset=footer_offset).tolist()
+        names_start = footer_offset + groups * 8
+        self.names = self.mm[names_start:names_start + names_size].split(b"\n") if stations else []
+        self.ids = {name: station for station, name in enumerate(self.names)}
+
+    def __enter__(self) -> "ColumnarIndex":
+        return self
+
+    def __exit__(self, exc_type: Optional[Type[BaseException]], exc: Optional[BaseException], traceback: Optional[TracebackType]) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Unmap and close the sidecar. Views returned by `row_groups` must be released first."""
+        self.mm.close()
+        self.file.close()
+
+    def row_groups(self) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Returns:
+            Iterator[Tuple[np.ndarray, np.ndarray]]: The station ID and temperature column of every row
+                group, as read-only views of the mapping.
+        """
+        for offset in self.offsets:
+            (rows,) = GROUP_HEADER.unpack_from(self.mm, offset)
+            start = offset + GROUP_HEADER.size
+            yield (
+                np.frombuffer(self.mm, dtype=np.uint16, count=rows, offset=start),
+                np.frombuffer(self.mm, dtype=np.int16, count=rows, offset=start + 2 * rows),
+            )
+
+    def select(self, stations: Sequence[bytes] = (), prefixes: Sequence[bytes] = ()) -> List[bytes]:
+        """
+        Returns:
+            List[bytes]: The stations of the index that are among stations or start with one of prefixes.
+        """
+        wanted = set(stations)
+        return [name for name in self.names if name in wanted or name.startswith(tuple(prefixes))]
+
+    def aggregate(self, stations: Optional[Iterable[bytes]] = None) -> Dict[bytes, City]:
+        """
+        Compute min, max, sum, and count for each station from the columns.
+        Args:
+            stations (Optional[Iterable[bytes]]): Only aggregate the rows of these stations, None for all.
+                Stations that don't occur in the file are left out of the result.
+        Returns:
+            Dict[bytes, City]: The results in integer tenths of a degree, like the numpy engine.
+        """
+        count = len(self.names)
+        selected : Optional[np.ndarray] = None
+        if stations is not None:
+            selected = np.zeros(count, dtype=bool)
+            selected[[self.ids[name] for name in stations if name in self.ids]] = True
+        counts = np.zeros(count, dtype=np.int64)
+        sums = np.zeros(count, dtype=np.int64)
+        mins = np.full(count, np.iinfo(np.int16).max, dtype=np.int16)
+        maxs = np.full(count, np.iinfo(np.int16).min, dtype=np.int16)
+        for ids, temps in self.row_groups():
+            if selected is not None:
+                rows = selected[ids]
+                ids, temps = ids[rows], temps[rows]
+            counts += np.bincount(ids, minlength=count)
+            sums += np.bincount(ids, weights=temps, minlength=count).astype(np.int64)
+            np.minimum.at(mins, ids, temps)
+            np.maximum.at(maxs, ids, temps)
+            del ids, temps
+        return {
+            self.names[station]: City(int(mins[station]), int(maxs[station]), int(sums[station]), int(counts[station]))
+            for station in np.flatnonzero(counts).tolist()
+        }
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Build the columnar sidecar of a measurements file from the command line."""
+    parser = argparse.ArgumentParser(prog="python -m onebrc.index", description="Convert a measurements file into a columnar sidecar")
+    parser.add_argument("file_path", help="The measurements file")
+    parser.add_argument("-o", "--output", help="The sidecar to write (default: <file_path>.idx)")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="Number of worker processes, defaults to the number of CPUs")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    rows = build(args.file_path, args.output, args.workers)
+    print(f"Indexed {rows:,} rows of '{args.file_path}' into '{args.output or index_path(args.file_path)}' in {time.perf_counter() - start:.2f} seconds")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
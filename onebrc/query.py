@@ -0,0 +1,169 @@
+import mmap
+import multiprocessing.pool
+import os
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import py_1brc_final
+from onebrc.backends import BACKENDS, Task, worker_pool
+from splitter import mmap_window, split_file
+from stations import City
+from wire import merge_encoded
+
+# Up to this many stations or prefixes, each is searched for on its own with `mmap.find`, which skips
+# every other line at memory speed. Beyond it, every line is split and its name looked up in a set.
+find_limit = 16
+
+def matches(mm: mmap.mmap, needle: bytes, position: int, end: int) -> Iterator[int]:
+    """
+    Find the lines of a range that start with needle[1:], where needle starts with a newline.
+    Args:
+        mm (mmap.mmap): The memory-mapped file.
+        needle (bytes): A newline followed by the start of the lines to find.
+        position (int): The start of the range, at the start of a line.
+        end (int): The end of the range, right after a newline or at the end of the file.
+    Returns:
+        Iterator[int]: The position of the newline before each matching line, or -1 for the first
+            line of the mapping.
+    """
+    if position == 0:
+        if mm[:len(needle) - 1] == needle[1:]:
+            yield -1
+    else:
+        # A range starts right after a newline, so its first line is found like the others.
+        position -= 1
+    while (hit := mm.find(needle, position, end)) >= 0:
+        yield hit
+        position = hit + len(needle)
+
+def add(result: Dict[bytes, City], location: bytes, measurement: int) -> None:
+    """Add a measurement in tenths to the results."""
+    _result = result.get(location)
+    if _result is None:
+        result[location] = City(measurement, measurement, measurement, 1)
+    else:
+        if measurement < _result.min:
+            _result.min = measurement
+        if measurement > _result.max:
+            _result.max = measurement
+        _result.sum += measurement
+        _result.count += 1
+
+def covering_prefixes(prefixes: Sequence[bytes]) -> List[bytes]:
+    """
+    Returns:
+        List[bytes]: The distinct prefixes that don't start with another of prefixes, which match the
+            same names without matching any name twice.
+    """
+    distinct = list(dict.fromkeys(prefixes))
+    return [prefix for prefix in distinct if not any(other != prefix and prefix.startswith(other) for other in distinct)]
+
+def query_range(mm: mmap.mmap, position: int, end: int, stations: Sequence[bytes], prefixes: Sequence[bytes], limit: Optional[int] = None) -> Dict[bytes, City]:
+    """
+    Compute min, max, sum, and count in tenths for the requested stations in a range of the file.
+    Lines of other stations are skipped on their name bytes, before their temperature is parsed.
+    Args:
+        mm (mmap.mmap): The memory-mapped file.
+        position (int): The start of the range, at the start of a line.
+        end (int): The end of the range, right after a newline or at the end of the file.
+        stations (Sequence[bytes]): The names of the stations to aggregate.
+        prefixes (Sequence[bytes]): Also aggregate every station whose name starts with one of these.
+        limit (Optional[int]): Search with `mmap.find` up to this many stations and prefixes, 0 to
+            split every line, defaults to `find_limit`.
+    Returns:
+        Dict[bytes, City]: The results of the requested stations that occur in the range.
+    """
+    result : Dict[bytes, City] = dict()
+    if len(stations) + len(prefixes) > (find_limit if limit is None else limit):
+        wanted = set(stations)
+        prefix_tuple = tuple(prefixes)
+        for block in py_1brc_final.iter_blocks(position, mm, 8 * 1024 * 1024, end):
+            for location, temp_str in py_1brc_final.split_rows(block):
+                if location in wanted or (prefix_tuple and location.startswith(prefix_tuple)):
+                    add(result, location, py_1brc_final.parse_temp(temp_str))
+        return result
+    for station in stations:
+        needle = b"\n" + station + b";"
+        for hit in matches(mm, needle, position, end):
+            line_end = mm.find(b"\n", hit + len(needle), end)
+            add(result, station, py_1brc_final.parse_temp(mm[hit + len(needle):line_end if line_end >= 0 else end]))
+    # A name matching two overlapping prefixes would be counted once per prefix.
+    for prefix in covering_prefixes(prefixes):
+        needle = b"\n" + prefix
+        for hit in matches(mm, needle, position, end):
+            semicolon = mm.find(b";", hit + len(needle), end)
+            line_end = mm.find(b"\n", semicolon, end)
+            location = mm[hit + 1:semicolon]
+            # A station matching both a name and a prefix was counted by the name already.
+            if location not in stations:
+                add(result, location, py_1brc_final.parse_temp(mm[semicolon + 1:line_end if line_end >= 0 else end]))
+    return result
+
+def query_chunk(chunk_start: int, chunk_end: int, file_path: str, stations: Sequence[bytes], prefixes: Sequence[bytes], limit: int) -> Dict[bytes, City]:
+    """
+    Run `query_range` on a chunk of the file in a worker.
+    Args:
+        chunk_start (int): The start position of the chunk, at the start of a line (see `splitter.split_file`).
+        chunk_end (int): The end position of the chunk, right after a newline or at the end of the file.
+        file_path (str): The measurements file.
+        stations (Sequence[bytes]): The names of the stations to aggregate.
+        prefixes (Sequence[bytes]): The name prefixes of the stations to aggregate.
+        limit (int): The limit of `query_range`, passed along because workers started with spawn
+            don't see a `find_limit` set in the parent.
+    Returns:
+        Dict[bytes, City]: The results of the requested stations that occur in the chunk.
+    """
+    offset, length, position = mmap_window(chunk_start, chunk_end)
+    with open(file_path, "rb") as file:
+        mm = mmap.mmap(file.fileno(), length=length, access=mmap.ACCESS_READ, offset=offset)
+        result = query_range(mm, position, length, stations, prefixes, limit)
+        mm.close()
+        return result
+
+def summarize(
+    file_path: str,
+    stations: Sequence[str] = (),
+    prefixes: Sequence[str] = (),
+    workers: Optional[int] = None,
+    chunk_size: int = py_1brc_final.segment_size,
+    use_index: bool = True,
+    pool: Optional[multiprocessing.pool.Pool] = None,
+    limit: Optional[int] = None,
+) -> Dict[bytes, City]:
+    """
+    Aggregate only the requested stations of a measurements file. With a sidecar built by
+    `onebrc.index` that still matches the file, the stations are read from its columns, otherwise the
+    text is scanned by `query_range` on a process pool.
+    Args:
+        file_path (str): The measurements file.
+        stations (Sequence[str]): The names of the stations to aggregate.
+        prefixes (Sequence[str]): Also aggregate every station whose name starts with one of these.
+        workers (Optional[int]): The number of worker processes, defaults to the number of CPUs.
+        chunk_size (int): Split the file into chunks of about this size, 0 for one chunk per worker.
+        use_index (bool): Read the sidecar of the file if there is a valid one.
+        pool (Optional[multiprocessing.pool.Pool]): Run on this process pool instead of starting one.
+        limit (Optional[int]): The limit of `query_range`, defaults to `find_limit` in this process.
+    Returns:
+        Dict[bytes, City]: The min, max, sum, and count in integer tenths of a degree of each requested
+            station that occurs in the file.
+    """
+    station_names = list(dict.fromkeys(station.encode() for station in stations))
+    prefix_names = list(dict.fromkeys(prefix.encode() for prefix in prefixes))
+    # The sidecar is read with numpy. It is imported here, so `python -m onebrc.index` runs its module
+    # once and the scan below still runs without numpy.
+    if use_index and BACKENDS["numpy"].available():
+        from onebrc.index import ColumnarIndex, index_path
+        if os.path.exists(index_path(file_path)):
+            try:
+                with ColumnarIndex(index_path(file_path), file_path) as index:
+                    return index.aggregate(index.select(station_names, prefix_names))
+            except ValueError:
+                pass
+    workers = workers or os.cpu_count() or 1
+    tasks : List[Task] = [
+        (query_chunk, (start, end, file_path, station_names, prefix_names, find_limit if limit is None else limit)) for start, end in split_file(file_path, workers, chunk_size)
+    ]
+    shared_results : Dict[bytes, City] = dict()
+    with worker_pool(workers, pool) as pool:
+        for packed_result in pool.imap_unordered(py_1brc_final.run_task_packed, tasks):
+            merge_encoded(shared_results, packed_result)
+    return shared_results
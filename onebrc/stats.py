@@ -0,0 +1,38 @@
+import multiprocessing
+import os
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+import py_1brc_final
+from onebrc.backends import plan_chunks
+
+if TYPE_CHECKING:
+    import histograms
+
+# The percentiles printed by --stats.
+default_percentiles = [50.0, 95.0, 99.0]
+
+def process_chunk(chunk: Tuple[str, int, int]) -> "histograms.Sparse":
+    """Build the histograms of a chunk planned by `plan_chunks` in a worker."""
+    import histograms
+    file_path, start, end = chunk
+    return histograms.process_chunk(start, end, file_path)
+
+def run_stats(file_paths: List[str], workers: Optional[int] = None, chunk_size: int = py_1brc_final.segment_size) -> "histograms.Histograms":
+    """
+    Build exact per station histograms of one or more measurements files, from which percentiles are
+    computed. This is a separate pass with the numpy engine, so runs without --stats don't pay for it.
+    Args:
+        file_paths (List[str]): The measurements files.
+        workers (Optional[int]): The number of worker processes, defaults to the number of CPUs.
+        chunk_size (int): The chunk size, see `plan_chunks`.
+    Returns:
+        histograms.Histograms: The merged histograms of every station.
+    """
+    # Imported here, so the package and the CLI import without numpy and can fall back to "pure".
+    import histograms
+    workers = workers or os.cpu_count() or 1
+    merged = histograms.Histograms()
+    with multiprocessing.Pool(workers) as pool:
+        for sparse in pool.imap_unordered(process_chunk, plan_chunks(file_paths, workers, chunk_size)):
+            merged.add(sparse)
+    return merged
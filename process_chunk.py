@@ -1,134 +1,111 @@
+import mmap
 import multiprocessing
 import os
-import mmap
-from typing import List, Dict, Tuple
-from dataclasses import dataclass
+from typing import Dict, final
 
-@dataclass
-class City:
-    min : float
-    max : float
-    sum : float
-    count : int
+from mypy_extensions import i64
+
+import py_1brc_final
+from splitter import mmap_window, split_file
+from stations import City
 
 # Path to the file containing measurements
 file_path = "../1brc/measurements.txt"
 
-def is_new_line(position: int, mm: mmap.mmap) -> bool:
+# True when this module runs as the extension built by mypyc (see "Building the mypyc kernel" in
+# the README), false when the plain .py file was imported instead.
+compiled = not __file__.endswith(".py")
+
+# Parse temperatures as integer tenths instead of floats. City aggregates are then
+# ints and only get scaled back to degrees when the results are printed. Compiled, this runs the
+# native kernel `process_block_native`; interpreted, float parsing is faster, so it is the fallback.
+fixed_point = compiled
+
+@final
+class Tenths:
     """
-    Check if the given position in the memory-mapped file is the start of a new line.
-    Args:
-        position (int): The position to check.
-        mm (mmap.mmap): The memory-mapped file object.
-    Returns:
-        bool: True if the position is the start of a new line, False otherwise.
+    Running min, max, sum, and count of one location in integer tenths of a degree. A final class
+    with `i64` attributes, which mypyc compiles into a C struct with unboxed fields.
     """
-    if position == 0:
-        return True
-    else:
-        mm.seek(position - 1)
-        return mm.read(1) == b"\n"
-    
-def next_line(position: int, mm: mmap.mmap) -> int:
+    def __init__(self, value: i64) -> None:
+        self.min : i64 = value
+        self.max : i64 = value
+        self.sum : i64 = value
+        self.count : i64 = 1
+
+def process_block_native(block: bytes, result: Dict[bytes, Tenths]) -> None:
     """
-    Move to the next line in the memory-mapped file from the given position.
+    Aggregate every line of a block into integer tenths, written for mypyc: the scan for the
+    semicolon and the temperature parsing index the `bytes` buffer with native `i64` arithmetic,
+    and the end of the line follows from the fixed temperature format instead of a second search.
     Args:
-        position (int): The current position in the file.
-        mm (mmap.mmap): The memory-mapped file object.
-    Returns:
-        int: The position of the start of the next line.
+        block (bytes): A block returned by `py_1brc_final.iter_blocks`.
+        result (Dict[bytes, Tenths]): The aggregates of the chunk, updated in place.
     """
-    mm.seek(position)
-    mm.readline()
-    return mm.tell()
+    size : i64 = len(block)
+    position : i64 = 0
+    while position < size:
+        # Station names are at least one byte long.
+        semicolon : i64 = position + 1
+        while block[semicolon] != 59:  # ASCII for ";"
+            semicolon += 1
+        index : i64 = semicolon + 1
+        negative = block[index] == 45  # ASCII for "-"
+        if negative:
+            index += 1
+        value : i64
+        if block[index + 1] == 46:  # ASCII for "."
+            value = block[index] * 10 + block[index + 2] - 528
+            index += 4
+        else:
+            value = block[index] * 100 + block[index + 1] * 10 + block[index + 3] - 5328
+            index += 5
+        if negative:
+            value = -value
+        location = block[position:semicolon]
+        _result = result.get(location)
+        if _result is None:
+            result[location] = Tenths(value)
+        else:
+            if value < _result.min:
+                _result.min = value
+            if value > _result.max:
+                _result.max = value
+            _result.sum += value
+            _result.count += 1
+        position = index
 
-def process_chunk(chunk_start: int, chunk_end: int) -> Dict[bytes, City]:
+def process_chunk(chunk_start: int, chunk_end: int, fixed_point: bool = False, block_size: int = 0, station_table: bool = False, path: str = "") -> Dict[bytes, City]:
     """
     Process a chunk of the file and compute min, max, sum, and count of measurements for each location.
+    Compiled with fixed_point, the chunk runs through `process_block_native`, every other combination
+    through `py_1brc_final.process_chunk`.
     Args:
-        chunk_start (int): The start position of the chunk.
-        chunk_end (int): The end position of the chunk.
+        chunk_start (int): The start position of the chunk, at the start of a line (see `splitter.split_file`).
+        chunk_end (int): The end position of the chunk, right after a newline or at the end of the file.
+        fixed_point (bool): Parse temperatures as integer tenths instead of floats.
+        block_size (int): Parse the chunk in blocks of this size instead of line by line, 0 to use mm.readline.
+        station_table (bool): Aggregate in a StationTable instead of a dict, always parsing in blocks.
+        path (str): The measurements file, defaults to the module level `file_path`.
     Returns:
         Dict[bytes, City]: A dictionary with location as key and a City class with min, max, sum, and count as value.
     """
-    chunk_size = chunk_end - chunk_start
+    if not (compiled and fixed_point) or station_table:
+        return py_1brc_final.process_chunk(chunk_start, chunk_end, fixed_point, block_size, station_table, path or file_path)
+    offset, length, position = mmap_window(chunk_start, chunk_end)
     print("Start:", chunk_start, " End:", chunk_end)
-    with open(file_path, "r+b") as file:
-        mm = mmap.mmap(file.fileno(), length=chunk_size, access=mmap.ACCESS_READ, offset=chunk_start)
-        if chunk_start != 0:
-            next_line(0, mm)
-        result : Dict[bytes, City] = dict()
-        for line in iter(mm.readline, b""):
-            location, temp_str = line.split(b";")
-            measurement = float(temp_str)
-            if location not in result:
-                result[location] = City(measurement, measurement, measurement, 1)  # min, max, sum, count
-            else:
-                _result = result[location]
-                if measurement < _result.min:
-                    _result.min = measurement
-                if measurement > _result.max:
-                    _result.max = measurement
-                _result.sum += measurement
-                _result.count += 1
-        mm.close()
-        return result
-    
-def identify_chunks(num_processes: int) -> List[Tuple[int, int]]:
-    """
-    Identify chunks of the file to be processed by different processes.
-    Args:
-        num_processes (int): The number of processes to use.
-    Returns:
-        List[Tuple[int, int]]: A list of tuples where each tuple contains the start and end positions of a chunk.
-    """
-    chunk_results = []
-    with open(file_path, "r+b") as file:
-        mm = mmap.mmap(file.fileno(), 0, flags=mmap.MAP_PRIVATE, prot=mmap.PROT_READ)
-        file_size = os.path.getsize(file_path)
-        print("File Size:", file_size)
-        print("Alloc Boundary:", mmap.ALLOCATIONGRANULARITY)
-        chunk_size = file_size // num_processes
-        chunk_size += mmap.ALLOCATIONGRANULARITY - (chunk_size % mmap.ALLOCATIONGRANULARITY)
-        start = 0
-        while start < file_size:
-            end = start + chunk_size
-            if end < file_size:
-                end = next_line(end, mm)
-            if start == end:
-                end = next_line(end, mm)
-            if end > file_size:
-                end = file_size
-                chunk_results.append((start, end))
-                break
-            chunk_results.append((start, end))
-            start += chunk_size
+    with open(path or file_path, "rb") as file:
+        mm = mmap.mmap(file.fileno(), length=length, access=mmap.ACCESS_READ, offset=offset)
+        tenths : Dict[bytes, Tenths] = dict()
+        for block in py_1brc_final.iter_blocks(position, mm, block_size or 8 * 1024 * 1024, length):
+            process_block_native(block, tenths)
         mm.close()
-        return chunk_results
+        return {location: City(int(t.min), int(t.max), int(t.sum), int(t.count)) for location, t in tenths.items()}
 
 def perform_op() -> None:
     num_processes = os.cpu_count() or 1
-    chunk_results = identify_chunks(num_processes)
+    chunk_results = split_file(file_path, num_processes, py_1brc_final.segment_size)
+    tasks = [(process_chunk, (start, end, fixed_point, py_1brc_final.block_size, py_1brc_final.station_table)) for start, end in chunk_results]
     with multiprocessing.Pool(num_processes) as pool:
-        ret_dicts = pool.starmap(process_chunk, chunk_results)
-    shared_results : Dict[bytes, City] = dict()
-    for return_dict in ret_dicts:
-        for station, data in return_dict.items():
-            if station in shared_results:
-                _result = shared_results[station]
-                _result = shared_results[station]
-                if data.min < _result.min:
-                    _result.min = data.min
-                if data.max > _result.max:
-                    _result.max = data.max
-                _result.sum += data.sum
-                _result.count += data.count
-            else:
-                shared_results[station] = data
-    print("{", end="")
-    for location, measurements in sorted(shared_results.items()):
-        print(
-            f"{location.decode('utf8')}={measurements.min:.1f}/{(measurements.sum / measurements.count) if measurements.count != 0 else 0:.1f}/{measurements.max:.1f}",
-            end=", ",
-        )
-    print("\b\b} ")
+        shared_results = py_1brc_final.merge_results(pool.imap_unordered(py_1brc_final.run_task, tasks))
+    py_1brc_final.print_results(shared_results, fixed_point)
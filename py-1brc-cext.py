@@ -1,12 +1,11 @@
-import ctypes
+import py_1brc_final
 
-# Load the shared library
-lib = ctypes.CDLL('./libcitytemp.so')
+# Path to the file containing measurements
+py_1brc_final.file_path = "./measurements_100mil.txt"
 
-# Define the argument and return types of the C function
-lib.process_file.argtypes = [ctypes.c_char_p]
-lib.process_file.restype = None
+# Process the chunks with process_range of libcitytemp.so (build it with make). Without the
+# library, main falls back to the pure Python engine.
+py_1brc_final.engine = "cext"
 
-# Call the C function
-filename = "./measurements_100mil.txt"
-lib.process_file(filename.encode('utf-8'))
\ No newline at end of file
+if __name__ == "__main__":
+    py_1brc_final.main()
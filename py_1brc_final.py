@@ -1,138 +1,355 @@
 import multiprocessing
+import multiprocessing.pool
 import os
 import mmap
-from typing import List, Dict, Tuple
-from dataclasses import dataclass
+import queue
+from itertools import chain, repeat
+from typing import Any, Callable, List, Dict, Iterable, Iterator, Sequence, Tuple, Union
 
-@dataclass
-class City:
-    min : float
-    max : float
-    sum : float
-    count : int
+import cext_chunk
+from splitter import mmap_window, split_file
+from stations import City, StationTable
+from wire import decode_results, encode_results, merge_encoded
 
 # Path to the file containing measurements
 file_path = "../1brc/measurements.txt"
 
-def is_new_line(position: int, mm: mmap.mmap) -> bool:
+# Parse temperatures as integer tenths instead of floats. City aggregates are then
+# ints and only get scaled back to degrees when the results are printed. Off by default
+# here, as the byte arithmetic is slower than float() when interpreted by CPython.
+fixed_point = False
+
+# Size of the slices process_chunk pulls out of the mmap at once. 0 falls back to
+# reading the chunk one line at a time with mm.readline.
+block_size = 8 * 1024 * 1024
+
+# Size of the line aligned segments the file is split into. Workers pull segments from the
+# pool as they finish the previous one, so a slow core or a page cache miss only delays one
+# segment. 0 falls back to one chunk per process.
+segment_size = 32 * 1024 * 1024
+
+# Look stations up in the open addressing StationTable instead of a dict. The table hashes and
+# compares names inside the mmap block without slicing them out, but the per byte hash loop is
+# still slower than the dict's hash of a sliced key, even compiled with mypyc, so it is off.
+station_table = False
+
+# Engine used to process each chunk: "python" for process_chunk below, "numpy" for the
+# vectorized numpy_chunk.process_chunk, or "cext" for process_range of libcitytemp.so through
+# cext_chunk.process_chunk, which falls back to "python" when the library hasn't been built.
+# The NumPy and C engines always aggregate integer tenths.
+engine = "python"
+
+# How the parent combines chunk results: "stream" folds each result in as it arrives, "tree"
+# hands pairs of results back to the pool to merge, so with many workers the parent isn't the
+# only process merging.
+merge_mode = "stream"
+
+# Send chunk results back to the parent in the compact format of wire.py instead of pickling
+# a dict of City objects.
+wire_format = True
+
+def parse_temp(temp: bytes, index: int = 0) -> int:
     """
-    Check if the given position in the memory-mapped file is the start of a new line.
+    Parse a temperature in the fixed one decimal format (`-?d?d.d`) into integer tenths of a degree.
     Args:
-        position (int): The position to check.
-        mm (mmap.mmap): The memory-mapped file object.
+        temp (bytes): The temperature bytes, optionally followed by a newline.
+        index (int): The position of the temperature in temp.
     Returns:
-        bool: True if the position is the start of a new line, False otherwise.
+        int: The temperature in tenths of a degree, e.g. b"-12.3" -> -123.
     """
-    if position == 0:
-        return True
-    else:
-        mm.seek(position - 1)
-        return mm.read(1) == b"\n"
-    
-def next_line(position: int, mm: mmap.mmap) -> int:
+    if temp[index] == 45:  # ASCII for "-"
+        if temp[index + 2] == 46:  # ASCII for "."
+            # -#.#, 528 == ord("0") * 11
+            return 528 - (temp[index + 1] * 10 + temp[index + 3])
+        # -##.#, 5328 == ord("0") * 111
+        return 5328 - (temp[index + 1] * 100 + temp[index + 2] * 10 + temp[index + 4])
+    if temp[index + 1] == 46:
+        return temp[index] * 10 + temp[index + 2] - 528
+    return temp[index] * 100 + temp[index + 1] * 10 + temp[index + 3] - 5328
+
+def iter_blocks(position: int, mm: Union[mmap.mmap, bytes], block_size: int, end: int = 0) -> Iterator[bytes]:
     """
-    Move to the next line in the memory-mapped file from the given position.
+    Read the memory-mapped file from the given position in blocks that end on a line boundary.
     Args:
-        position (int): The current position in the file.
-        mm (mmap.mmap): The memory-mapped file object.
+        position (int): The position to start reading from, must be the start of a line.
+        mm (Union[mmap.mmap, bytes]): The memory-mapped file object, or a buffer of lines.
+        block_size (int): The target size of each block. A block is cut at the last newline inside it,
+            and only grows beyond block_size when a single line is longer than a block.
+        end (int): The position to stop at, right after a newline or at the end of the file, 0 for
+            the end of the mapping.
     Returns:
-        int: The position of the start of the next line.
+        Iterator[bytes]: The blocks, each holding only complete lines. The last block may lack the
+            trailing newline if the file does not end with one.
     """
-    mm.seek(position)
-    mm.readline()
-    return mm.tell()
+    size = end or len(mm)
+    while position < size:
+        block_end = mm.rfind(b"\n", position, min(position + block_size, size)) + 1
+        if block_end <= position:
+            block_end = mm.find(b"\n", position + block_size, size) + 1 or size
+        yield mm[position:block_end]
+        position = block_end
 
-def process_chunk(chunk_start: int, chunk_end: int) -> Dict[bytes, City]:
+def split_rows(block: bytes) -> Iterator[Tuple[bytes, bytes]]:
+    """
+    Split a block of complete lines into (location, temperature) pairs with one pass over the block.
+    Args:
+        block (bytes): A block returned by `iter_blocks`.
+    Returns:
+        Iterator[Tuple[bytes, bytes]]: The location and temperature bytes of each line.
+    """
+    fields = iter(block.replace(b";", b"\n").split(b"\n"))
+    # A trailing newline leaves an odd field out at the end, which zip drops.
+    return zip(fields, fields)
+
+def process_block_table(block: bytes, table: StationTable, fixed_point: bool) -> None:
+    """
+    Add every line of a block to the station table, without slicing out the station names.
+    Args:
+        block (bytes): A block returned by `iter_blocks`.
+        table (StationTable): The table to add the measurements to.
+        fixed_point (bool): Parse temperatures as integer tenths instead of floats.
+    """
+    position = 0
+    size = len(block)
+    while position < size:
+        semicolon = block.find(b";", position)
+        end = block.find(b"\n", semicolon)
+        if end < 0:
+            end = size
+        measurement = parse_temp(block, semicolon + 1) if fixed_point else float(block[semicolon + 1:end])
+        table.add(block, position, semicolon, measurement)
+        position = end + 1
+
+def process_range(mm: Union[mmap.mmap, bytes], position: int, end: int, fixed_point: bool = False, block_size: int = 0, station_table: bool = False) -> Dict[bytes, City]:
+    """
+    Compute min, max, sum, and count of measurements for each location in a range of a memory-mapped file.
+    Only reads from explicit positions when block_size is set, so threads can share one mapping.
+    Args:
+        mm (Union[mmap.mmap, bytes]): The memory-mapped file object, or a buffer of lines when block_size is set.
+        position (int): The start of the range, at the start of a line.
+        end (int): The end of the range, right after a newline or at the end of the file.
+        fixed_point (bool): Parse temperatures as integer tenths instead of floats.
+        block_size (int): Parse the range in blocks of this size instead of line by line. 0 uses
+            mm.readline, which moves the file position of the mapping and reads to its end, so the
+            range must then end with the mapping.
+        station_table (bool): Aggregate in a StationTable instead of a dict, always parsing in blocks.
+    Returns:
+        Dict[bytes, City]: A dictionary with location as key and a City class with min, max, sum, and count as value.
+    """
+    if station_table:
+        table = StationTable()
+        for block in iter_blocks(position, mm, block_size or 8 * 1024 * 1024, end):
+            process_block_table(block, table, fixed_point)
+        return table.to_dict()
+    rows : Iterator[Sequence[bytes]]
+    if block_size:
+        rows = chain.from_iterable(map(split_rows, iter_blocks(position, mm, block_size, end)))
+    else:
+        assert isinstance(mm, mmap.mmap)
+        mm.seek(position)
+        rows = map(bytes.split, iter(mm.readline, b""), repeat(b";"))
+    result : Dict[bytes, City] = dict()
+    for location, temp_str in rows:
+        measurement = parse_temp(temp_str) if fixed_point else float(temp_str)
+        _result = result.get(location)
+        if _result is None:
+            result[location] = City(measurement, measurement, measurement, 1)  # min, max, sum, count
+        else:
+            if measurement < _result.min:
+                _result.min = measurement
+            if measurement > _result.max:
+                _result.max = measurement
+            _result.sum += measurement
+            _result.count += 1
+    return result
+
+def process_chunk(chunk_start: int, chunk_end: int, fixed_point: bool = False, block_size: int = 0, station_table: bool = False, path: str = "") -> Dict[bytes, City]:
     """
     Process a chunk of the file and compute min, max, sum, and count of measurements for each location.
     Args:
-        chunk_start (int): The start position of the chunk.
-        chunk_end (int): The end position of the chunk.
+        chunk_start (int): The start position of the chunk, at the start of a line (see `splitter.split_file`).
+        chunk_end (int): The end position of the chunk, right after a newline or at the end of the file.
+        fixed_point (bool): Parse temperatures as integer tenths instead of floats.
+        block_size (int): Parse the chunk in blocks of this size instead of line by line, 0 to use mm.readline.
+        station_table (bool): Aggregate in a StationTable instead of a dict, always parsing in blocks.
+        path (str): The measurements file, defaults to the module level `file_path`.
     Returns:
         Dict[bytes, City]: A dictionary with location as key and a City class with min, max, sum, and count as value.
     """
-    chunk_size = chunk_end - chunk_start
+    offset, length, position = mmap_window(chunk_start, chunk_end)
     print("Start:", chunk_start, " End:", chunk_end)
-    with open(file_path, "r+b") as file:
-        mm = mmap.mmap(file.fileno(), length=chunk_size, access=mmap.ACCESS_READ, offset=chunk_start)
-        if chunk_start != 0:
-            next_line(0, mm)
-        result : Dict[bytes, City] = dict()
-        for line in iter(mm.readline, b""):
-            location, temp_str = line.split(b";")
-            measurement = float(temp_str)
-            if location not in result:
-                result[location] = City(measurement, measurement, measurement, 1)  # min, max, sum, count
-            else:
-                _result = result[location]
-                if measurement < _result.min:
-                    _result.min = measurement
-                if measurement > _result.max:
-                    _result.max = measurement
-                _result.sum += measurement
-                _result.count += 1
+    with open(path or file_path, "r+b") as file:
+        mm = mmap.mmap(file.fileno(), length=length, access=mmap.ACCESS_READ, offset=offset)
+        result = process_range(mm, position, length, fixed_point, block_size, station_table)
         mm.close()
         return result
     
-def identify_chunks(num_processes: int) -> List[Tuple[int, int]]:
+def identify_chunks(num_processes: int, segment_size: int = 0) -> List[Tuple[int, int]]:
     """
     Identify chunks of the file to be processed by different processes.
     Args:
         num_processes (int): The number of processes to use.
+        segment_size (int): Split the file into chunks of about this size instead of one chunk per process.
     Returns:
         List[Tuple[int, int]]: A list of tuples where each tuple contains the start and end positions of a chunk.
     """
-    chunk_results = []
-    with open(file_path, "r+b") as file:
-        mm = mmap.mmap(file.fileno(), 0, flags=mmap.MAP_PRIVATE, prot=mmap.PROT_READ)
-        file_size = os.path.getsize(file_path)
-        print("File Size:", file_size)
-        print("Alloc Boundary:", mmap.ALLOCATIONGRANULARITY)
-        chunk_size = file_size // num_processes
-        chunk_size += mmap.ALLOCATIONGRANULARITY - (chunk_size % mmap.ALLOCATIONGRANULARITY)
-        start = 0
-        while start < file_size:
-            end = start + chunk_size
-            if end < file_size:
-                end = next_line(end, mm)
-            if start == end:
-                end = next_line(end, mm)
-            if end > file_size:
-                end = file_size
-                chunk_results.append((start, end))
-                break
-            chunk_results.append((start, end))
-            start += chunk_size
-        mm.close()
-        return chunk_results
-    
-def main() -> None:
-    """Main function to process the file using multiple processes and print the results.
+    print("File Size:", os.path.getsize(file_path))
+    print("Alloc Boundary:", mmap.ALLOCATIONGRANULARITY)
+    return split_file(file_path, num_processes, segment_size)
+
+def run_task(task: Tuple[Callable[..., Dict[bytes, City]], Tuple[Any, ...]]) -> Dict[bytes, City]:
+    """
+    Call a chunk processing function, so different engines can be scheduled with `Pool.imap_unordered`.
+    Args:
+        task (Tuple[Callable, Tuple]): The function and its arguments.
+    Returns:
+        Dict[bytes, City]: The result of the function.
+    """
+    function, args = task
+    return function(*args)
+
+def run_task_packed(task: Tuple[Callable[..., Dict[bytes, City]], Tuple[Any, ...]]) -> bytes:
+    """
+    Call a chunk processing function and pack its result with `encode_results`.
+    Args:
+        task (Tuple[Callable, Tuple]): The function and its arguments.
+    Returns:
+        bytes: The packed result of the function.
+    """
+    return encode_results(run_task(task))
+
+def merge_into(shared_results: Dict[bytes, City], return_dict: Dict[bytes, City]) -> None:
+    """
+    Fold the result of one chunk into the merged results.
+    Args:
+        shared_results (Dict[bytes, City]): The merged results, updated in place.
+        return_dict (Dict[bytes, City]): The result returned by `process_chunk` for a chunk.
+    """
+    for station, data in return_dict.items():
+        _result = shared_results.get(station)
+        if _result is None:
+            shared_results[station] = data
+        else:
+            if data.min < _result.min:
+                _result.min = data.min
+            if data.max > _result.max:
+                _result.max = data.max
+            _result.sum += data.sum
+            _result.count += data.count
+
+def merge_results(ret_dicts: Iterable[Dict[bytes, City]]) -> Dict[bytes, City]:
+    """
+    Merge the per chunk results into a single result per location, folding each one in as it arrives.
+    Args:
+        ret_dicts (Iterable[Dict[bytes, City]]): The results returned by `process_chunk` for each chunk.
+    Returns:
+        Dict[bytes, City]: The merged min, max, sum, and count for each location.
     """
-    num_processes = os.cpu_count() or 1
-    chunk_results = identify_chunks(num_processes)
-    with multiprocessing.Pool(num_processes) as pool:
-        ret_dicts = pool.starmap(process_chunk, chunk_results)
     shared_results : Dict[bytes, City] = dict()
     for return_dict in ret_dicts:
-        for station, data in return_dict.items():
-            if station in shared_results:
-                _result = shared_results[station]
-                if data.min < _result.min:
-                    _result.min = data.min
-                if data.max > _result.max:
-                    _result.max = data.max
-                _result.sum += data.sum
-                _result.count += data.count
-            else:
-                shared_results[station] = data
+        merge_into(shared_results, return_dict)
+    return shared_results
+
+def merge_pair(left: Dict[bytes, City], right: Dict[bytes, City]) -> Dict[bytes, City]:
+    """
+    Merge two results, so a merge can run as a pool task.
+    Args:
+        left (Dict[bytes, City]): A result, updated in place.
+        right (Dict[bytes, City]): Another result.
+    Returns:
+        Dict[bytes, City]: The merged result.
+    """
+    merge_into(left, right)
+    return left
+
+def merge_packed(left: bytes, right: bytes) -> bytes:
+    """
+    Merge two results packed with `encode_results`, so a merge can run as a pool task.
+    Args:
+        left (bytes): A packed result.
+        right (bytes): Another packed result.
+    Returns:
+        bytes: The packed merged result.
+    """
+    return encode_results(merge_pair(decode_results(left), decode_results(right)))
+
+def tree_merge(pool: multiprocessing.pool.Pool, tasks: List[Tuple[Callable[..., Dict[bytes, City]], Tuple[Any, ...]]], packed: bool = False) -> Dict[bytes, City]:
+    """
+    Run the chunk tasks and reduce their results as a tree: whenever two results are ready, merging
+    them is submitted back to the pool, until a single result is left.
+    Args:
+        pool (multiprocessing.pool.Pool): The pool to run the chunk and merge tasks on.
+        tasks (List[Tuple[Callable, Tuple]]): The chunk tasks, see `run_task`.
+        packed (bool): Pass results between processes in the format of wire.py.
+    Returns:
+        Dict[bytes, City]: The merged min, max, sum, and count for each location.
+    """
+    ready : queue.SimpleQueue = queue.SimpleQueue()
+    for task in tasks:
+        pool.apply_async(run_task_packed if packed else run_task, (task,), callback=ready.put, error_callback=ready.put)
+    outstanding = len(tasks)
+    carry : Any = encode_results(dict()) if packed else dict()
+    has_carry = False
+    while outstanding:
+        result = ready.get()
+        outstanding -= 1
+        if isinstance(result, BaseException):
+            raise result
+        if has_carry:
+            pool.apply_async(merge_packed if packed else merge_pair, (carry, result), callback=ready.put, error_callback=ready.put)
+            outstanding += 1
+            has_carry = False
+        else:
+            carry = result
+            has_carry = True
+    return decode_results(carry) if packed else carry
+
+def print_results(shared_results: Dict[bytes, City], fixed_point: bool = False) -> None:
+    """
+    Print the merged results as `{station=min/mean/max, ...}` sorted by station.
+    Args:
+        shared_results (Dict[bytes, City]): The merged results for all locations.
+        fixed_point (bool): The aggregates hold integer tenths and need scaling back to degrees.
+    """
+    scale = 10 if fixed_point else 1
     print("{", end="")
     for location, measurements in sorted(shared_results.items()):
         print(
-            f"{location.decode('utf8')}={measurements.min:.1f}/{(measurements.sum / measurements.count) if measurements.count != 0 else 0:.1f}/{measurements.max:.1f}",
+            f"{location.decode('utf8')}={measurements.min / scale:.1f}/{(measurements.sum / (measurements.count * scale)) if measurements.count != 0 else 0:.1f}/{measurements.max / scale:.1f}",
             end=", ",
         )
     print("\b\b} ")
 
+def main() -> None:
+    """Main function to process the file using multiple processes and print the results.
+    """
+    num_processes = os.cpu_count() or 1
+    chunk_results = identify_chunks(num_processes, segment_size)
+    tasks : List[Tuple[Callable[..., Dict[bytes, City]], Tuple[Any, ...]]]
+    tenths = fixed_point
+    if engine == "numpy":
+        import numpy_chunk
+        tasks = [(numpy_chunk.process_chunk, (start, end, file_path)) for start, end in chunk_results]
+        tenths = True
+    elif engine == "cext" and cext_chunk.available():
+        tasks = [(cext_chunk.process_chunk, (start, end, file_path)) for start, end in chunk_results]
+        tenths = True
+    else:
+        if engine == "cext":
+            print(f"{cext_chunk.library_path} not found, falling back to the python engine")
+        tasks = [(process_chunk, (start, end, fixed_point, block_size, station_table)) for start, end in chunk_results]
+    shared_results : Dict[bytes, City]
+    with multiprocessing.Pool(num_processes) as pool:
+        if merge_mode == "tree":
+            shared_results = tree_merge(pool, tasks, wire_format)
+        elif wire_format:
+            shared_results = dict()
+            for packed_result in pool.imap_unordered(run_task_packed, tasks):
+                merge_encoded(shared_results, packed_result)
+        else:
+            shared_results = merge_results(pool.imap_unordered(run_task, tasks))
+    print_results(shared_results, tenths)
+
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
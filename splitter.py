@@ -0,0 +1,54 @@
+import mmap
+import os
+from typing import List, Tuple
+
+def split_file(file_path: str, num_chunks: int = 1, chunk_size: int = 0, start: int = 0, end: int = 0) -> List[Tuple[int, int]]:
+    """
+    Split a file, or the range [start, end) of it, into line aligned chunks.
+
+    Contract: the chunks are ordered, non empty and together cover [start, end) exactly, so every
+    byte (and therefore every line) is owned by exactly one chunk. Every chunk starts at the start of
+    a line and ends right after a newline, or at the end of the file if it doesn't end in one. A chunk
+    never starts or ends in the middle of a line, so consumers must not skip a partial first line.
+    Args:
+        file_path (str): The file to split.
+        num_chunks (int): The number of chunks to aim for when chunk_size is 0.
+        chunk_size (int): The size to aim for per chunk. A chunk only grows past it to finish its last line.
+        start (int): The start of the range, which must be the start of a line.
+        end (int): The end of the range, right after a newline or at the end of the file, 0 for the end
+            of the file.
+    Returns:
+        List[Tuple[int, int]]: The start and end positions of each chunk.
+    """
+    range_end = end or os.path.getsize(file_path)
+    if range_end <= start:
+        return []
+    target = chunk_size or -(-(range_end - start) // max(num_chunks, 1))
+    chunks = []
+    with open(file_path, "rb") as file:
+        mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        while start < range_end:
+            end = start + target
+            if end < range_end:
+                # The chunk ends after the first newline at or after end - 1, which is end itself when
+                # end already falls on the start of a line.
+                end = mm.find(b"\n", end - 1, range_end) + 1 or range_end
+            else:
+                end = range_end
+            chunks.append((start, end))
+            start = end
+        mm.close()
+    return chunks
+
+def mmap_window(chunk_start: int, chunk_end: int) -> Tuple[int, int, int]:
+    """
+    Compute the mmap arguments for a chunk, as mmap offsets must be multiples of ALLOCATIONGRANULARITY.
+    Args:
+        chunk_start (int): The start position of the chunk.
+        chunk_end (int): The end position of the chunk.
+    Returns:
+        Tuple[int, int, int]: The aligned offset and the length to map, and the position of the chunk
+            start inside the mapping.
+    """
+    offset = chunk_start - chunk_start % mmap.ALLOCATIONGRANULARITY
+    return offset, chunk_end - offset, chunk_start - offset
@@ -0,0 +1,738 @@
+import contextlib
+import dataclasses
+import io
+import mmap
+import os
+import random
+import shutil
+import sys
+import tempfile
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import py_1brc_final
+import splitter
+import wire
+from archive.create_better_measurements import CreateMeasurement
+from stations import City
+
+def create_measurements(file_name: str, records: int, seed: int = 0) -> None:
+    """
+    Create a reproducible measurements file using the standard generator.
+    Args:
+        file_name (str): The file to write.
+        records (int): The number of rows to write.
+        seed (int): The seed for both the `random` and `numpy` generators.
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+    with contextlib.redirect_stdout(io.StringIO()):
+        CreateMeasurement().generateMeasurementFile(file_name=file_name, records=records)
+
+def run_final(file_name: str, fixed_point: bool, block_size: int = 0) -> Tuple[str, Dict[bytes, py_1brc_final.City]]:
+    """
+    Run py_1brc_final.py in process over the given file and capture the printed output.
+    Args:
+        file_name (str): The measurements file.
+        fixed_point (bool): Parse temperatures as integer tenths instead of floats.
+        block_size (int): Parse in blocks of this size, 0 to read line by line.
+    Returns:
+        Tuple[str, Dict[bytes, City]]: The printed `{station=min/mean/max, ...}` line and the merged results.
+    """
+    py_1brc_final.file_path = file_name
+    with contextlib.redirect_stdout(io.StringIO()):
+        chunks = py_1brc_final.identify_chunks(4)
+        ret_dicts = [py_1brc_final.process_chunk(start, end, fixed_point, block_size) for start, end in chunks]
+    shared_results = py_1brc_final.merge_results(ret_dicts)
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        py_1brc_final.print_results(shared_results, fixed_point)
+    return output.getvalue(), shared_results
+
+def check_fixed_point(file_name: str) -> None:
+    """
+    Check that integer tenths parsing prints byte identical output to float parsing.
+    Two differences are allowed, as the float path is not a stable reference for them: it prints
+    whichever of -0.0 and 0.0 it saw first, and a mean that lies exactly halfway between two tenths
+    rounds whichever way the accumulated summation error points.
+    """
+    with open(file_name, "rb") as file:
+        for line in file:
+            temp = line.split(b";")[1]
+            assert py_1brc_final.parse_temp(temp) == round(float(temp) * 10), temp
+    fixed_output, fixed_results = run_final(file_name, fixed_point=True)
+    float_output, _ = run_final(file_name, fixed_point=False)
+    if fixed_output == float_output:
+        return
+    fixed_entries, float_entries = fixed_output.split(", "), float_output.split(", ")
+    assert len(fixed_entries) == len(float_entries)
+    for fixed_entry, float_entry in zip(fixed_entries, float_entries):
+        if fixed_entry == float_entry:
+            continue
+        location, fixed_values = fixed_entry.lstrip("{").split("=")
+        fixed_min, fixed_mean, fixed_max = (float(value) for value in fixed_values.rstrip("\n} \b").split("/"))
+        float_min, float_mean, float_max = (float(value) for value in float_entry.split("=")[1].rstrip("\n} \b").split("/"))
+        city = fixed_results[location.encode("utf8")]
+        is_tie = (2 * int(city.sum)) % city.count == 0 and (2 * int(city.sum)) // city.count % 2 == 1
+        assert fixed_min == float_min and fixed_max == float_max, (fixed_entry, float_entry)
+        assert fixed_mean == float_mean or is_tie, (fixed_entry, float_entry)
+
+def check_block_reader(file_name: str) -> None:
+    """Check that block parsing prints the same output as the mm.readline loop, including tiny blocks."""
+    expected, _ = run_final(file_name, fixed_point=True)
+    for block_size in (1, 37, 4096, py_1brc_final.block_size):
+        assert run_final(file_name, fixed_point=True, block_size=block_size)[0] == expected, block_size
+
+def check_station_table(file_name: str) -> None:
+    """Check that aggregating in the open addressing StationTable gives the same results as the dict."""
+    py_1brc_final.file_path = file_name
+    with contextlib.redirect_stdout(io.StringIO()):
+        chunks = py_1brc_final.identify_chunks(4)
+    for fixed_point in (False, True):
+        _, expected = run_final(file_name, fixed_point)
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = py_1brc_final.merge_results(
+                py_1brc_final.process_chunk(start, end, fixed_point, 4096, True) for start, end in chunks
+            )
+        assert results == expected, fixed_point
+
+def check_numpy_engine(file_name: str) -> None:
+    """Check that the NumPy engine prints exactly the same output as the fixed point Python engine."""
+    import numpy_chunk
+    expected, _ = run_final(file_name, fixed_point=True)
+    default_block_size = numpy_chunk.block_size
+    try:
+        for numpy_block_size in (64, 100_000, default_block_size):
+            numpy_chunk.block_size = numpy_block_size
+            with contextlib.redirect_stdout(io.StringIO()):
+                chunks = py_1brc_final.identify_chunks(4)
+                ret_dicts = [numpy_chunk.process_chunk(start, end, file_name) for start, end in chunks]
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                py_1brc_final.print_results(py_1brc_final.merge_results(ret_dicts), fixed_point=True)
+            assert output.getvalue() == expected, numpy_block_size
+    finally:
+        numpy_chunk.block_size = default_block_size
+
+def random_measurements(rng: random.Random) -> bytes:
+    """
+    Create random measurement file contents that stress chunk boundaries.
+    Args:
+        rng (random.Random): The random generator.
+    Returns:
+        bytes: The file contents, with odd sizes, names of up to 100 bytes (some multi-byte UTF-8) and
+            sometimes no trailing newline.
+    """
+    names = [
+        "".join(rng.choice("abcXYZ éü°-") for _ in range(rng.randint(1, 100))).encode("utf8")[:100]
+        for _ in range(rng.randint(1, 12))
+    ]
+    lines = [
+        rng.choice(names) + b";" + f"{rng.randint(-999, 999) / 10:.1f}".encode()
+        for _ in range(rng.randint(0, 400))
+    ]
+    contents = b"\n".join(lines)
+    return contents + b"\n" if lines and rng.random() < 0.7 else contents
+
+def check_splitter(file_name: str) -> None:
+    """
+    Property check of `splitter.split_file` on random small files: the chunks partition the file on
+    line boundaries, the mmap windows are aligned, and processing the chunks counts every line once.
+    """
+    rng = random.Random(1)
+    split_file_name = os.path.join(os.path.dirname(file_name), "split.txt")
+    py_1brc_final.file_path = split_file_name
+    for _ in range(300):
+        contents = random_measurements(rng)
+        with open(split_file_name, "wb") as file:
+            file.write(contents)
+        expected: Dict[bytes, List[int]] = dict()
+        for line in contents.splitlines():
+            location, temp = line.split(b";")
+            expected.setdefault(location, []).append(py_1brc_final.parse_temp(temp))
+        for num_chunks, chunk_size in ((1, 0), (rng.randint(2, 64), 0), (1, rng.randint(1, 300)), (1, 4096)):
+            chunks = splitter.split_file(split_file_name, num_chunks, chunk_size)
+            assert bool(chunks) == bool(contents), chunks
+            assert [start for start, _ in chunks] == [0] + [end for _, end in chunks[:-1]] or not chunks, chunks
+            assert (chunks[-1][1] if chunks else 0) == len(contents), chunks
+            for start, end in chunks:
+                assert start < end, chunks
+                assert start == 0 or contents[start - 1:start] == b"\n", (start, chunks)
+                assert end == len(contents) or contents[end - 1:end] == b"\n", (end, chunks)
+                offset, length, position = splitter.mmap_window(start, end)
+                assert offset % mmap.ALLOCATIONGRANULARITY == 0 and offset + position == start and offset + length == end
+            for block_size in (0, rng.randint(1, 200)):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    results = py_1brc_final.merge_results(
+                        py_1brc_final.process_chunk(start, end, True, block_size) for start, end in chunks
+                    )
+                assert {location: (city.min, city.max, city.sum, city.count) for location, city in results.items()} == {
+                    location: (min(temps), max(temps), sum(temps), len(temps)) for location, temps in expected.items()
+                }, (num_chunks, chunk_size, block_size)
+        # A range of whole lines, as split for the tail of a grown file.
+        line_starts = [0] + [index + 1 for index, byte in enumerate(contents) if byte == 10]
+        if len(line_starts) > 1:
+            range_start, range_end = sorted(rng.sample(line_starts, 2))
+            chunks = splitter.split_file(split_file_name, rng.randint(1, 8), rng.choice((0, rng.randint(1, 100))), range_start, range_end)
+            assert [start for start, _ in chunks] == [range_start] + [end for _, end in chunks[:-1]], chunks
+            assert chunks[-1][1] == range_end, chunks
+            assert all(contents[end - 1:end] == b"\n" for _, end in chunks), chunks
+
+def quiet_worker() -> None:
+    """Silence the progress prints of pool workers."""
+    sys.stdout = open(os.devnull, "w")
+
+def check_tree_merge(file_name: str) -> None:
+    """Check that merging results as a tree in the pool prints the same output as streaming them into the parent."""
+    import multiprocessing
+    expected, _ = run_final(file_name, fixed_point=True)
+    py_1brc_final.file_path = file_name
+    with contextlib.redirect_stdout(io.StringIO()):
+        chunks = py_1brc_final.identify_chunks(2, 64 * 1024)
+    tasks = [(py_1brc_final.process_chunk, (start, end, True, py_1brc_final.block_size)) for start, end in chunks]
+    for packed in (False, True):
+        with multiprocessing.Pool(2, initializer=quiet_worker) as pool:
+            shared_results = py_1brc_final.tree_merge(pool, tasks, packed)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            py_1brc_final.print_results(shared_results, fixed_point=True)
+        assert output.getvalue() == expected, packed
+
+def check_wire_format(file_name: str) -> None:
+    """Check that chunk results survive the round trip through the compact wire format."""
+    for fixed_point in (False, True):
+        _, shared_results = run_final(file_name, fixed_point)
+        assert wire.decode_results(wire.encode_results(shared_results)) == shared_results, fixed_point
+    assert wire.decode_results(wire.encode_results(dict())) == dict()
+
+def check_native_kernel(file_name: str) -> None:
+    """
+    Check that the mypyc kernel of process_chunk.py aggregates the same tenths as py_1brc_final.py.
+    Runs the compiled kernel when process_chunk has been built in place, the plain module otherwise.
+    """
+    import process_chunk
+    _, expected = run_final(file_name, fixed_point=True)
+    for block_size in (64, 4096, os.path.getsize(file_name)):
+        tenths : Dict[bytes, process_chunk.Tenths] = dict()
+        with open(file_name, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for block in py_1brc_final.iter_blocks(0, mm, block_size):
+                process_chunk.process_block_native(block, tenths)
+        results = {location: py_1brc_final.City(int(t.min), int(t.max), int(t.sum), int(t.count)) for location, t in tenths.items()}
+        assert results == expected, block_size
+
+def check_cext_engine(file_name: str) -> Optional[str]:
+    """Check that the C engine of libcitytemp.so aggregates the same tenths as py_1brc_final.py."""
+    import cext_chunk
+    if not cext_chunk.available():
+        return "skipped, libcitytemp.so not built (run make)"
+    _, expected = run_final(file_name, fixed_point=True)
+    default_buffer_size = cext_chunk.buffer_size
+    try:
+        # A buffer too small for the result makes process_chunk retry with the reported size.
+        for buffer_size in (16, default_buffer_size):
+            cext_chunk.buffer_size = buffer_size
+            cext_chunk._buffer = None
+            with contextlib.redirect_stdout(io.StringIO()):
+                chunks = py_1brc_final.identify_chunks(4, 100_000)
+                results = py_1brc_final.merge_results(cext_chunk.process_chunk(start, end, file_name) for start, end in chunks)
+            assert results == expected, buffer_size
+    finally:
+        cext_chunk.buffer_size = default_buffer_size
+        cext_chunk._buffer = None
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert cext_chunk.process_chunk(0, 0, file_name) == dict()
+    return None
+
+def check_backends(file_name: str) -> Optional[str]:
+    """
+    Check that every backend of `python -m onebrc` that can run here aggregates the same results as
+    py_1brc_final.py, on the process pool and, where supported, on threads sharing one mapping. Float sums depend on the order they are added up in, so they only need to be close.
+    """
+    import math
+    import onebrc
+    skipped = []
+    for name, backend in onebrc.BACKENDS.items():
+        if not backend.available():
+            skipped.append(name)
+            continue
+        _, expected = run_final(file_name, backend.tenths)
+        for executor in ("processes", "threads") if backend.range_task else ("processes",):
+            with contextlib.redirect_stdout(io.StringIO()):
+                results = onebrc.run(file_name, backend, 2, 100_000, executor=executor)
+            assert results.keys() == expected.keys(), (name, executor)
+            for location, city in results.items():
+                other = expected[location]
+                assert (city.min, city.max, city.count) == (other.min, other.max, other.count), (name, executor, location)
+                assert math.isclose(city.sum, other.sum, rel_tol=1e-9, abs_tol=1e-6), (name, executor, location)
+    return f"OK, skipped {', '.join(skipped)} (not available)" if skipped else None
+
+def check_generator(file_name: str) -> None:
+    """
+    Check that the batched generator writes `records` lines in the `name;temp` format with one decimal,
+    and the same file for a seed regardless of the number of processes.
+    """
+    import re
+    from onebrc.generate import BATCH_ROWS, generate
+    records = BATCH_ROWS * 2 + 1000
+    contents = []
+    for processes in (1, 3):
+        generated = os.path.join(os.path.dirname(file_name), f"generated_{processes}.txt")
+        generate(generated, records, seed=1, processes=processes)
+        with open(generated, "rb") as file:
+            contents.append(file.read())
+        os.remove(generated)
+    assert contents[0] == contents[1]
+    lines = contents[0].split(b"\n")
+    assert lines.pop() == b"" and len(lines) == records
+    line_format = re.compile(rb"[^;\n]+;-?[0-9]{1,2}\.[0-9]")
+    assert all(line_format.fullmatch(line) for line in lines)
+
+def check_adversarial_dataset(file_name: str) -> Optional[str]:
+    """
+    Check the backends on 10k stations with long multi-byte names, a shared prefix and Zipfian
+    frequencies, the generator modes that stress hash tables and merges.
+    """
+    from onebrc.generate import MAX_NAME_BYTES, generate, synthetic_stations
+    stations = synthetic_stations(10_000, seed=1, name_bytes=MAX_NAME_BYTES, shared_prefix=24)
+    assert len({name for name, _ in stations}) == len(stations)
+    assert all(len(name.encode()) <= MAX_NAME_BYTES and ";" not in name for name, _ in stations)
+    generated = os.path.join(os.path.dirname(file_name), "adversarial.txt")
+    generate(generated, 100_000, seed=1, stations=stations, zipf=1.1)
+    try:
+        return check_backends(generated)
+    finally:
+        os.remove(generated)
+
+def check_checkpoint(file_name: str) -> None:
+    """
+    Check that incremental runs over a growing file give the results of a full run, and that the
+    checkpoint is invalidated when the file is truncated, rewritten or replaced instead of appended to,
+    or the checkpoint is damaged.
+    """
+    import onebrc
+    from onebrc import checkpoint
+    backend = onebrc.BACKENDS["numpy"]
+    with open(file_name, "rb") as source:
+        contents = source.read()
+    directory = os.path.dirname(file_name)
+    grown = os.path.join(directory, "grown.txt")
+    checkpoint_path = os.path.join(directory, "grown.checkpoint")
+
+    def full_run() -> Dict[bytes, City]:
+        with contextlib.redirect_stdout(io.StringIO()):
+            return onebrc.run(grown, backend, 2, 100_000, executor="threads")
+
+    def incremental_run() -> Dict[bytes, City]:
+        with contextlib.redirect_stdout(io.StringIO()):
+            return checkpoint.run_incremental(checkpoint_path, grown, backend, 2, 100_000, executor="threads")
+
+    # Append in pieces that end mid-line, the partial line has to wait for the next run.
+    with open(grown, "wb") as output:
+        for end in (len(contents) // 3 + 5, len(contents) // 2 + 7, len(contents)):
+            output.write(contents[output.tell():end])
+            output.flush()
+            results = incremental_run()
+        assert results == full_run()
+    offset = checkpoint.complete_lines_end(grown)
+    assert checkpoint.load(checkpoint_path, grown, backend.tenths) is not None
+    assert checkpoint.load(checkpoint_path, grown, not backend.tenths) is None
+
+    # Rewritten with the same length and lines, and truncated.
+    middle = contents.index(b"\n", offset // 2) + 1
+    rewritten = contents[middle:offset] + contents[:middle]
+    with open(grown, "wb") as output:
+        output.write(rewritten)
+    assert checkpoint.load(checkpoint_path, grown, backend.tenths) is None
+    assert incremental_run() == full_run()
+    os.truncate(grown, rewritten.index(b"\n", offset // 4) + 1)
+    assert checkpoint.load(checkpoint_path, grown, backend.tenths) is None
+    assert incremental_run() == full_run()
+
+    # Replaced by a new file with the same bytes, and a damaged checkpoint.
+    with open(grown, "rb") as source, open(grown + ".new", "wb") as output:
+        output.write(source.read())
+    os.replace(grown + ".new", grown)
+    assert checkpoint.load(checkpoint_path, grown, backend.tenths) is None
+    assert incremental_run() == full_run()
+    assert checkpoint.load(checkpoint_path, grown, backend.tenths) is not None
+    # Cut by a few bytes, by one whole record that still decodes, and with two names run together.
+    for cut in (5, 32):
+        os.truncate(checkpoint_path, os.path.getsize(checkpoint_path) - cut)
+        assert checkpoint.load(checkpoint_path, grown, backend.tenths) is None, cut
+        assert incremental_run() == full_run()
+    with open(checkpoint_path, "rb") as source:
+        data = source.read()
+    names_start = checkpoint.HEADER.size + wire.HEADER.size
+    names_end = data.index(b"\n", names_start)
+    with open(checkpoint_path, "wb") as output:
+        output.write(data[:names_end] + b"x" + data[names_end + 1:])
+    assert checkpoint.load(checkpoint_path, grown, backend.tenths) is None
+    assert incremental_run() == full_run()
+    os.remove(grown)
+    os.remove(checkpoint_path)
+
+def check_follow(file_name: str) -> None:
+    """
+    Check that following a file yields the results of its complete lines after every append, parses
+    every line once, and starts over when the file is truncated or rotated.
+    """
+    from onebrc import checkpoint
+    from onebrc.follow import follow
+    with open(file_name, "rb") as source:
+        contents = source.read()
+    directory = os.path.dirname(file_name)
+    followed = os.path.join(directory, "followed.txt")
+    checkpoint_path = os.path.join(directory, "followed.checkpoint")
+
+    def expected(data: bytes) -> Dict[bytes, City]:
+        data = data[:data.rfind(b"\n") + 1]
+        with open(os.path.join(directory, "expected.txt"), "wb") as output:
+            output.write(data)
+        return run_final(os.path.join(directory, "expected.txt"), True, 64 * 1024)[1]
+
+    middle = len(contents) // 2 + 3
+    shorter = contents[:contents.index(b"\n", len(contents) // 4) + 1]
+    with open(followed, "wb") as output:
+        output.write(contents[:middle])
+    snapshots = follow(followed, 0, 1, True, checkpoint_path)
+    assert next(snapshots) == expected(contents[:middle])
+    with open(followed, "ab") as output:
+        output.write(contents[middle:])
+    assert next(snapshots) == expected(contents)
+    loaded = checkpoint.load(checkpoint_path, followed, True)
+    assert loaded is not None and loaded[0] == len(contents)
+    with open(followed, "wb") as output:
+        output.write(shorter)
+    assert next(snapshots) == expected(shorter)
+    # A rename based rotation leaves a longer file at the path, so only its inode tells it apart.
+    os.rename(followed, followed + ".1")
+    with open(followed, "wb") as output:
+        output.write(contents[:middle])
+    assert next(snapshots) == expected(contents[:middle])
+    snapshots.close()
+    for path in (followed, followed + ".1", checkpoint_path, os.path.join(directory, "expected.txt")):
+        os.remove(path)
+
+def check_multi_file(file_name: str) -> None:
+    """
+    Check that a directory of shards gives the results of the file they were cut from, overall and per
+    shard, with the process and the thread executor.
+    """
+    import onebrc
+    backend = onebrc.BACKENDS["numpy"]
+    with open(file_name, "rb") as source:
+        contents = source.read()
+    shards = os.path.join(os.path.dirname(file_name), "shards")
+    os.makedirs(shards)
+    cuts = [0] + [contents.index(b"\n", len(contents) * index // 7) + 1 for index in range(1, 7)] + [len(contents)]
+    for index, (start, end) in enumerate(zip(cuts, cuts[1:])):
+        with open(os.path.join(shards, f"measurements-{index}.txt"), "wb") as output:
+            output.write(contents[start:end])
+    # An empty shard, and a file that doesn't match the pattern.
+    open(os.path.join(shards, "measurements-7.txt"), "wb").close()
+    open(os.path.join(shards, "notes.md"), "wb").close()
+
+    file_paths = onebrc.input_files(shards)
+    assert file_paths == onebrc.input_files(os.path.join(shards, "measurements-*.txt"))
+    assert len(file_paths) == 8
+    with contextlib.redirect_stdout(io.StringIO()):
+        expected = onebrc.run(file_name, backend, 2, 0, executor="threads")
+        expected_per_file = {file_path: onebrc.run(file_path, backend, 1, 0, executor="threads") for file_path in file_paths}
+        for executor in ("processes", "threads"):
+            for chunk_size in (0, 64 * 1024):
+                shared_results, file_results = onebrc.run_files(file_paths, backend, 3, chunk_size, executor, True)
+                assert shared_results == expected
+                assert file_results == expected_per_file
+    for path in os.listdir(shards):
+        os.remove(os.path.join(shards, path))
+    os.rmdir(shards)
+
+def check_compressed(file_name: str) -> Optional[str]:
+    """
+    Check that gzip and zstd files give the results of the uncompressed file, both when decompressed as
+    a stream and in parallel, with lines split across blocks, members, frames and tasks.
+    """
+    import gzip
+    import importlib.util
+    import onebrc
+    from onebrc import compressed
+    backend = onebrc.BACKENDS["numpy"]
+    with open(file_name, "rb") as source:
+        contents = source.read()
+    with contextlib.redirect_stdout(io.StringIO()):
+        expected = onebrc.run(file_name, backend, 1)
+    directory = os.path.dirname(file_name)
+    sizes = compressed.frame_size, compressed.buffer_size, compressed.task_size
+    files = {"gzip": "stream", "members.gz": "stream", "bgzf.gz": "parallel"}
+    with open(os.path.join(directory, "gzip"), "wb") as output:
+        output.write(gzip.compress(contents))
+    with open(os.path.join(directory, "members.gz"), "wb") as output:
+        output.write(gzip.compress(contents[:len(contents) // 3]) + gzip.compress(contents[len(contents) // 3:]))
+    compressed.compress(file_name, os.path.join(directory, "bgzf.gz"), "gzip")
+    note = None
+    if importlib.util.find_spec("zstandard") is not None:
+        import zstandard  # type: ignore[import-not-found]
+        with open(os.path.join(directory, "zstd"), "wb") as output:
+            output.write(zstandard.ZstdCompressor().compress(contents))
+        compressed.frame_size = 10_000
+        compressed.compress(file_name, os.path.join(directory, "seekable.zst"), "zstd")
+        files.update({"zstd": "stream", "seekable.zst": "parallel"})
+    else:
+        note = "skipped zstd (zstandard not installed)"
+
+    compressed.buffer_size = 50_000
+    compressed.task_size = 30_000
+    for name, mode in files.items():
+        path = os.path.join(directory, name)
+        kind = compressed.compression(path)
+        assert kind is not None
+        with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            parts = compressed.gzip_members(mm) if kind == "gzip" else compressed.zstd_frames(mm)
+        assert (parts is not None) == (mode == "parallel")
+        assert compressed.run_compressed(path, backend, 2) == expected, name
+        os.remove(path)
+    compressed.frame_size, compressed.buffer_size, compressed.task_size = sizes
+    assert compressed.compression(file_name) is None
+    return note
+
+def check_histograms(file_name: str) -> None:
+    """
+    Check that the histograms of --stats give the aggregates of the numpy engine and the exact nearest
+    rank percentiles of the parsed measurements, however the file is chunked and merged.
+    """
+    import histograms
+    import onebrc
+    measurements : Dict[bytes, List[int]] = dict()
+    with open(file_name, "rb") as file:
+        for line in file:
+            name, temperature = line.rstrip(b"\n").split(b";")
+            measurements.setdefault(name, []).append(py_1brc_final.parse_temp(temperature))
+    with contextlib.redirect_stdout(io.StringIO()):
+        expected = onebrc.run(file_name, onebrc.BACKENDS["numpy"], 1)
+    percentiles = [0, 1, 50, 95, 99, 99.9, 100]
+    for workers, chunk_size in ((1, 0), (3, 50_000)):
+        merged = onebrc.run_stats([file_name], workers, chunk_size)
+        assert merged.to_dict() == expected
+        values = merged.percentiles(percentiles)
+        for name, temperatures in measurements.items():
+            assert values[name] == [int(value) for value in np.percentile(temperatures, percentiles, method="inverted_cdf")], name
+
+    # Few stations for the rows take the dense counting path of process_block.
+    dense = histograms.Histograms()
+    dense.add(histograms.process_block(np.frombuffer(b"a;1.0\nb;-2.5\na;99.9\n" * 1000, dtype=np.uint8)))
+    assert dense.to_dict() == {b"a": City(10, 999, 1_009_000, 2000), b"b": City(-25, -25, -25_000, 1000)}
+    assert dense.percentiles([50, 51]) == {b"a": [10, 999], b"b": [-25, -25]}
+    doubled = histograms.Histograms()
+    doubled.add(dense.sparse())
+    doubled.add(dense.sparse())
+    assert doubled.to_dict()[b"a"] == City(10, 999, 2_018_000, 4000)
+
+def check_cache(file_name: str) -> None:
+    """
+    Check that cached results round trip, that changing a file changes its key, and that the least
+    recently used entries are evicted first.
+    """
+    from onebrc import cache
+    directory = os.path.dirname(file_name)
+    settings = cache.cache_dir, cache.max_bytes
+    cache.cache_dir = os.path.join(directory, "cache")
+    copy = os.path.join(directory, "copy.txt")
+    with open(file_name, "rb") as source, open(copy, "wb") as output:
+        contents = source.read()
+        output.write(contents)
+
+    _, results = run_final(copy, False, 64 * 1024)
+    key = cache.cache_key([copy], False)
+    assert cache.load(key) is None
+    cache.store(key, results)
+    assert cache.load(key) == results
+    assert cache.cache_key([copy], False) == key != cache.cache_key([copy], True)
+    assert key != cache.cache_key([copy, file_name], False)
+    hashed = cache.cache_key([copy], False, True)
+    # A rewrite of the same size changes the sampled contents, and any write the change time.
+    with open(copy, "r+b") as output:
+        output.write(contents[len(contents) // 2:] + contents[:len(contents) // 2])
+    assert cache.cache_key([copy], False) != key
+    assert cache.cache_key([copy], False, True) != hashed
+    with open(os.path.join(cache.cache_dir, key + ".bin"), "r+b") as output:
+        output.truncate(10)
+    assert cache.load(key) is None
+    os.remove(os.path.join(cache.cache_dir, key + ".bin"))
+
+    # Three entries in a cache with room for two: the one used least recently goes.
+    keys = [f"{index:040x}" for index in range(3)]
+    for index, entry in enumerate(keys):
+        cache.store(entry, results)
+        os.utime(os.path.join(cache.cache_dir, entry + ".bin"), (index + 1, index + 1))
+    assert cache.load(keys[0]) == results
+    cache.max_bytes = 2 * os.path.getsize(os.path.join(cache.cache_dir, keys[0] + ".bin"))
+    cache.evict()
+    assert [cache.load(entry) is not None for entry in keys] == [True, False, True]
+
+    cache.cache_dir, cache.max_bytes = settings
+    shutil.rmtree(os.path.join(directory, "cache"))
+    os.remove(copy)
+
+def check_columnar_index(file_name: str) -> None:
+    """
+    Check that the columnar sidecar aggregates like the numpy engine, in full and for a subset of the
+    stations, that it is refused once the text file changed, and that a rejected build leaves no file.
+    """
+    import onebrc
+    from onebrc import index as index_module
+    from onebrc.index import ColumnarIndex, build, index_path
+    with contextlib.redirect_stdout(io.StringIO()):
+        expected = onebrc.run(file_name, onebrc.BACKENDS["numpy"], 1)
+    directory = os.path.dirname(file_name)
+    copy = os.path.join(directory, "indexed.txt")
+    shutil.copyfile(file_name, copy)
+    # Small chunks so the sidecar has many row groups.
+    assert build(copy, workers=3, chunk_size=64 * 1024) == sum(city.count for city in expected.values())
+    subset = sorted(expected)[::7]
+    with ColumnarIndex(index_path(copy), copy) as index:
+        assert index.aggregate() == expected
+        assert index.aggregate(subset + [b"Nowhere"]) == {name: expected[name] for name in subset}
+        assert index.aggregate([]) == {}
+    with open(copy, "ab") as output:
+        output.write(b"Nowhere;1.0\n")
+    try:
+        ColumnarIndex(index_path(copy), copy)
+        assert False, "a stale index was accepted"
+    except ValueError:
+        pass
+    max_stations = index_module.MAX_STATIONS
+    try:
+        index_module.MAX_STATIONS = 1
+        build(copy, output_path=index_path(copy) + ".rejected")
+        assert False, "too many stations were accepted"
+    except ValueError:
+        assert not os.path.exists(index_path(copy) + ".rejected.tmp")
+    finally:
+        index_module.MAX_STATIONS = max_stations
+    open(copy, "wb").close()
+    build(copy)
+    with ColumnarIndex(index_path(copy), copy) as index:
+        assert index.aggregate() == {}
+    os.remove(copy)
+    os.remove(index_path(copy))
+
+def check_query(file_name: str) -> None:
+    """
+    Check that a station subset or name prefix query gives the results of the numpy engine for those
+    stations, both with `mmap.find` and with the split path, over one chunk and many, and on a file
+    whose first line is a requested station and whose last line has no newline.
+    """
+    import onebrc
+    from onebrc import query
+    with contextlib.redirect_stdout(io.StringIO()):
+        expected = onebrc.run(file_name, onebrc.BACKENDS["numpy"], 1)
+    names = sorted(expected)
+    subset = names[::9]
+    prefix = names[len(names) // 2][:2]
+    wanted = {name: expected[name] for name in expected if name in subset or name.startswith(prefix)}
+    first = os.path.join(os.path.dirname(file_name), "query.txt")
+    with open(first, "wb") as output:
+        output.write(b"Alpha;1.5\nBeta;-2.0\nAlphabet;3.0\nAlpha;-7.5")
+    # The limit goes in the task arguments, so the split path is taken by workers of any start method.
+    for limit in (query.find_limit, 0):
+        for workers, chunk_size in ((1, 0), (3, 64 * 1024)):
+            results = onebrc.summarize(file_name, [name.decode() for name in subset] + ["Nowhere"], [prefix.decode()], workers, chunk_size, use_index=False, limit=limit)
+            assert results == wanted, (limit, workers, chunk_size)
+        assert onebrc.summarize(first, ["Alpha"], use_index=False, limit=limit) == {b"Alpha": City(-75, 15, -60, 2)}
+        assert onebrc.summarize(first, [], ["Al"], use_index=False, limit=limit) == {b"Alpha": City(-75, 15, -60, 2), b"Alphabet": City(30, 30, 30, 1)}
+        overlapping = onebrc.summarize(first, ["Alpha"], ["A", "Al", "Alph"], use_index=False, limit=limit)
+        assert overlapping == {b"Alpha": City(-75, 15, -60, 2), b"Alphabet": City(30, 30, 30, 1)}, limit
+    os.remove(first)
+
+def check_api(file_name: str) -> None:
+    """
+    Check that the library API returns the results of the numpy engine, keeps its pool between calls,
+    warns instead of printing when a backend falls back, and that the JSON, CSV and columnar writers
+    round trip.
+    """
+    import csv
+    import json
+    import warnings
+    import onebrc
+    from onebrc import api
+    with contextlib.redirect_stdout(io.StringIO()):
+        expected = api.to_stats(onebrc.run(file_name, onebrc.BACKENDS["numpy"], 1), True)
+    with onebrc.Aggregator(workers=2, chunk_size=64 * 1024) as aggregator:
+        results = aggregator.aggregate(file_name)
+        pool = aggregator.pool
+        assert results == expected
+        assert list(results) == sorted(expected)
+        subset = list(expected)[::11]
+        assert aggregator.aggregate(file_name, stations=subset) == {station: expected[station] for station in subset}
+        assert aggregator.aggregate(file_name, backend="pure").keys() == expected.keys()
+        onebrc.register(dataclasses.replace(onebrc.BACKENDS["pure"], name="missing", available=lambda: False))
+        try:
+            printed = io.StringIO()
+            with contextlib.redirect_stdout(printed), warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter("always")
+                assert aggregator.aggregate(file_name, backend="missing").keys() == expected.keys()
+            assert printed.getvalue() == "" and [warning.category for warning in caught] == [RuntimeWarning]
+        finally:
+            del onebrc.BACKENDS["missing"]
+        assert aggregator.pool is pool
+    assert onebrc.aggregate(file_name) == expected
+    output = io.StringIO()
+    api.write_json(results, output)
+    assert json.loads(output.getvalue()) == {station: dataclasses.asdict(stats) for station, stats in results.items()}
+    output = io.StringIO(newline="")
+    api.write_csv(results, output)
+    rows = list(csv.reader(io.StringIO(output.getvalue(), newline="")))
+    assert rows[0] == ["station", "min", "mean", "max", "count"] and len(rows) == len(results) + 1
+    assert {row[0]: api.Stats(float(row[1]), float(row[2]), float(row[3]), int(row[4])) for row in rows[1:]} == results
+    batch_rows = api.batch_rows
+    try:
+        # Small batches so the stream has several.
+        api.batch_rows = 7
+        binary = io.BytesIO()
+        api.write_columns(results, binary)
+    finally:
+        api.batch_rows = batch_rows
+    binary.seek(0)
+    assert api.read_columns(binary) == results
+    binary = io.BytesIO()
+    api.write_columns({}, binary)
+    binary.seek(0)
+    assert api.read_columns(binary) == {}
+
+CHECKS: Dict[str, Callable[[str], Optional[str]]] = {
+    "splitter": check_splitter,
+    "fixed_point": check_fixed_point,
+    "block_reader": check_block_reader,
+    "station_table": check_station_table,
+    "numpy_engine": check_numpy_engine,
+    "tree_merge": check_tree_merge,
+    "wire_format": check_wire_format,
+    "native_kernel": check_native_kernel,
+    "cext_engine": check_cext_engine,
+    "backends": check_backends,
+    "generator": check_generator,
+    "adversarial_dataset": check_adversarial_dataset,
+    "checkpoint": check_checkpoint,
+    "follow": check_follow,
+    "multi_file": check_multi_file,
+    "compressed": check_compressed,
+    "histograms": check_histograms,
+    "cache": check_cache,
+    "columnar_index": check_columnar_index,
+    "query": check_query,
+    "api": check_api,
+}
+
+def main(argv: List[str]) -> None:
+    """Run the correctness checks over a small generated measurements file."""
+    records = int(argv[1]) if len(argv) > 1 else 200_000
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_name = os.path.join(tmp_dir, "measurements.txt")
+        create_measurements(file_name, records)
+        for name, check in CHECKS.items():
+            note = check(file_name)
+            print(f"{name}: {note or 'OK'}")
+
+if __name__ == "__main__":
+    main(sys.argv)
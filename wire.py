@@ -0,0 +1,76 @@
+import struct
+from array import array
+from itertools import chain
+from typing import Dict, Iterator, Tuple
+
+from stations import City
+
+# Header: record typecode ("q" for integer tenths, "d" for floats), number of stations and
+# size of the station name table in bytes.
+HEADER = struct.Struct("<cII")
+
+def encode_results(result: Dict[bytes, City]) -> bytes:
+    """
+    Pack the result of a chunk into a compact binary form for the trip back to the parent process.
+    The layout is the header, the station names joined by newlines (which can't occur in a name), and
+    one array of (min, max, sum, count) records in native byte order, in the same order as the names.
+    Args:
+        result (Dict[bytes, City]): The result returned by `process_chunk`.
+    Returns:
+        bytes: The packed result.
+    """
+    cities = result.values()
+    typecode = "q" if not cities or isinstance(next(iter(cities)).sum, int) else "d"
+    records = array(typecode, chain.from_iterable((city.min, city.max, city.sum, city.count) for city in cities))
+    names = b"\n".join(result)
+    return HEADER.pack(typecode.encode(), len(result), len(names)) + names + records.tobytes()
+
+def iter_records(data: bytes) -> Iterator[Tuple[bytes, float, float, float, int]]:
+    """
+    Iterate over a result packed by `encode_results` without building a City per station.
+    Args:
+        data (bytes): The packed result.
+    Returns:
+        Iterator[Tuple[bytes, float, float, float, int]]: The location, min, max, sum, and count of each station.
+    """
+    typecode, stations, names_size = HEADER.unpack_from(data)
+    if not stations:
+        return iter(())
+    names_end = HEADER.size + names_size
+    names = data[HEADER.size:names_end].split(b"\n")
+    records = array(typecode.decode())
+    records.frombytes(data[names_end:])
+    values = iter(records)
+    if typecode == b"q":
+        return zip(names, values, values, values, values)
+    return ((name, _min, _max, _sum, int(count)) for name, _min, _max, _sum, count in zip(names, values, values, values, values))
+
+def decode_results(data: bytes) -> Dict[bytes, City]:
+    """
+    Unpack a result packed by `encode_results`.
+    Args:
+        data (bytes): The packed result.
+    Returns:
+        Dict[bytes, City]: The result with location as key and a City class with min, max, sum, and count as value.
+    """
+    return {name: City(_min, _max, _sum, count) for name, _min, _max, _sum, count in iter_records(data)}
+
+def merge_encoded(shared_results: Dict[bytes, City], data: bytes) -> None:
+    """
+    Fold a result packed by `encode_results` into the merged results, reading the records straight
+    from the packed array instead of first decoding them into City objects.
+    Args:
+        shared_results (Dict[bytes, City]): The merged results, updated in place.
+        data (bytes): The packed result.
+    """
+    for name, _min, _max, _sum, count in iter_records(data):
+        _result = shared_results.get(name)
+        if _result is None:
+            shared_results[name] = City(_min, _max, _sum, count)
+        else:
+            if _min < _result.min:
+                _result.min = _min
+            if _max > _result.max:
+                _result.max = _max
+            _result.sum += _sum
+            _result.count += count